@@ -0,0 +1,91 @@
+# backup.py
+# pipelined backup of all programs and names from the evolver
+
+import asyncio
+import statistics
+from time import perf_counter
+
+import memory
+import utils
+from engine import AsyncEvolver
+
+log = utils.get_logger("backup")
+log.setLevel(20)
+
+
+def latency_report(latencies: list) -> dict:
+    """percentiles of request latencies in seconds"""
+    if len(latencies) < 2:
+        return {"count": len(latencies)}
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "count": len(latencies),
+        "min": min(latencies),
+        "p50": percentiles[49],
+        "p90": percentiles[89],
+        "p99": percentiles[98],
+        "max": max(latencies),
+    }
+
+
+async def backup(
+    engine: AsyncEvolver,
+    store: memory.PatchStore = None,
+    window: int = 8,
+    timeout: float = 2.0,
+    retries: int = 3,
+) -> dict:
+    """fetch every program and name into 'store'
+
+    at most 'window' requests are in flight at a time. replies are matched
+    by (bank, program) and written to the store as they arrive. a request
+    that times out is sent again up to 'retries' times.
+    """
+    if store is None:
+        store = memory.patch
+    slots = asyncio.Semaphore(window)
+    latencies = []
+    failed = []
+
+    async def fetch(request, store_reply, bank: int, prog: int):
+        async with slots:
+            for attempt in range(retries + 1):
+                start = perf_counter()
+                try:
+                    reply = await request(bank, prog, timeout=timeout)
+                except asyncio.TimeoutError:
+                    log.warning(f"timeout {request.__name__} {bank=} {prog=}")
+                    continue
+                latencies.append(perf_counter() - start)
+                store_reply(bank, prog, reply)
+                return
+            failed.append((request.__name__, bank, prog))
+
+    def store_program(bank: int, prog: int, reply: dict):
+        store.update(bank, prog, reply["patch"])
+
+    def store_name(bank: int, prog: int, reply: dict):
+        store.set_name(bank, prog, reply["name"])
+
+    start = perf_counter()
+    await asyncio.gather(
+        *(
+            fetch(request, store_reply, bank, prog)
+            for bank, prog in store
+            for request, store_reply in (
+                (engine.request_program, store_program),
+                (engine.request_name, store_name),
+            )
+        )
+    )
+    report = {
+        "seconds": perf_counter() - start,
+        "requests": 2 * len(store),
+        "failed": failed,
+        "latency": latency_report(latencies),
+    }
+    log.info(
+        f"backup of {len(store)} programs in {report['seconds']:.1f}s, "
+        f"{len(failed)} failed"
+    )
+    return report
@@ -0,0 +1,301 @@
+# batch.py
+# offline conversion and editing of program files, no midi required
+#
+# programs stream through generators as {"bank", "prog", "patch"} dicts, the
+# layout evolver.receive_sysex returns for a program partition. a patch holds
+# every program parameter, "seq" and "name" like program_memory.json.
+
+import os
+from itertools import groupby
+from operator import itemgetter
+from time import perf_counter
+
+import evolver
+import library
+import mapping
+import memory
+import parameters
+import utils
+from evolver import Partition
+
+# file formats by extension
+FORMATS = {".json": "json", ".syx": "syx", ".evl": "library"}
+
+
+def file_format(filename: str) -> str:
+    extension = os.path.splitext(filename)[1].lower()
+    try:
+        return FORMATS[extension]
+    except KeyError:
+        raise ValueError(
+            f"unknown file format: {filename!r}, use {', '.join(FORMATS)}"
+        ) from None
+
+
+def complete(patch: dict) -> dict:
+    """patch with current parameter names, missing values zero"""
+    complete = dict.fromkeys(parameters.program, 0)
+    for key, value in patch.items():
+        match key:
+            case "seq":
+                complete["seq"] = list(value)
+            case "name":
+                complete["name"] = value
+            case _:
+                complete[parameters.program[memory.program_index[key]]] = value
+    complete.setdefault("seq", [0] * memory.PatchStore.STEPS)
+    complete.setdefault("name", memory.PatchStore.DEFAULT_NAME.decode("ascii"))
+    return complete
+
+
+def read_json(filename: str):
+    for bank, programs in utils.load_json(filename).items():
+        for prog, patch in programs.items():
+            yield {
+                "bank": int(bank),
+                "prog": int(prog),
+                "patch": complete(patch),
+            }
+
+
+def read_syx(filename: str):
+    """programs of a .syx file, each with the name that follows it, if any"""
+    pending = None
+    for message in utils.load_sysex(filename):
+        match message:
+            case {"patch": patch}:
+                if pending is not None:
+                    yield pending
+                pending = message | {"patch": complete(patch)}
+            case {"name": name} if pending is not None and (
+                message["bank"],
+                message["prog"],
+            ) == (pending["bank"], pending["prog"]):
+                pending["patch"]["name"] = name
+                yield pending
+                pending = None
+    if pending is not None:
+        yield pending
+
+
+def read_library(filename: str):
+    with library.open_library(filename) as programs:
+        for bank, prog in programs.patches:
+            yield {
+                "bank": bank,
+                "prog": prog,
+                "patch": programs.patches.as_dict(bank, prog),
+            }
+
+
+_readers = {"json": read_json, "syx": read_syx, "library": read_library}
+
+
+def read_programs(filename: str):
+    """stream the programs of a .json, .syx or library file"""
+    return _readers[file_format(filename)](filename)
+
+
+_fields = itemgetter("bank", "prog", "patch")
+
+
+def _name_bytes(name: str) -> bytes:
+    return (
+        name[: memory.PatchStore.NAME]
+        .ljust(memory.PatchStore.NAME)
+        .encode("ascii")
+    )
+
+
+def write_json(filename: str, programs) -> int:
+    banks = {}
+    for bank, prog, patch in map(_fields, programs):
+        banks.setdefault(bank, {})[prog] = patch
+    utils.save_json(filename, banks)
+    return sum(map(len, banks.values()))
+
+
+def _frame(data: list) -> bytes:
+    return bytes(
+        (
+            utils.SYSEX_START,
+            *evolver.sysex_id,
+            *evolver.serialize(data),
+            utils.SYSEX_END,
+        )
+    )
+
+
+def write_syx(filename: str, programs) -> int:
+    """write program and name partitions, one program at a time"""
+    count = 0
+    with open(filename, "wb") as file:
+        for bank, prog, patch in map(_fields, programs):
+            program = evolver.serialize_program(patch)
+            name = _name_bytes(patch["name"])
+            file.write(_frame([Partition.PROGRAM, bank, prog, *program]))
+            file.write(_frame([Partition.NAME, bank, prog, *name]))
+            count += 1
+    return count
+
+
+def write_library(filename: str, programs) -> int:
+    """write a library of as many banks as the highest bank written"""
+    store = memory.PatchStore()
+    banks = count = 0
+    for program in programs:
+        bank = program["bank"]
+        store.update(bank, program["prog"], program["patch"])
+        banks = max(banks, bank + 1)
+        count += 1
+    size = banks * 128 * store.RECORD
+    library.save_library(
+        filename, memory.PatchStore(banks, store.buffer[:size]), {}
+    )
+    return count
+
+
+_writers = {"json": write_json, "syx": write_syx, "library": write_library}
+
+
+def write_programs(filename: str, programs) -> int:
+    """write a stream of programs, returns their number
+
+    the file is written next to 'filename' and moved in place when complete,
+    so an input can be rewritten in place and failed runs leave no partial
+    output.
+    """
+    writer = _writers[file_format(filename)]
+    temporary = f"{filename}.part{os.path.splitext(filename)[1]}"
+    try:
+        count = writer(temporary, programs)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    os.replace(temporary, filename)
+    return count
+
+
+def select_banks(programs, banks):
+    banks = frozenset(banks)
+    return (program for program in programs if program["bank"] in banks)
+
+
+def move_to_bank(programs, bank: int):
+    if bank not in range(4):
+        raise ValueError(f"no such bank: {bank=}")
+    return (program | {"bank": bank} for program in programs)
+
+
+def parse_assignment(text: str) -> tuple:
+    """'osc_slop=2' or 'osc1_shape=Tri' as (parameter index, value)
+
+    the value is read as display shows it (osc1_fine=-10), a number that is
+    no label of the parameter as the raw value 0-255, see mapping.parse
+    """
+    name, separator, value = text.partition("=")
+    if not separator:
+        raise ValueError(f"expected parameter=value, got {text!r}")
+    try:
+        parameter = memory.program_index[name.strip()]
+    except KeyError:
+        raise ValueError(f"unknown parameter: {name!r}") from None
+    return parameter, mapping.parse(parameter, value)
+
+
+def set_parameters(programs, assignments: dict):
+    """set parameters, by index as from parse_assignment, on every program"""
+    values = {parameters.program[n]: value for n, value in assignments.items()}
+    for program in programs:
+        program["patch"].update(values)
+        yield program
+
+
+def rename(programs, template: str):
+    """rename with a format string of 'name', 'bank' and 'prog'
+
+    names are cut to 16 characters, e.g. "{name:.12} {prog:03}"
+    """
+    for program in programs:
+        patch = program["patch"]
+        patch["name"] = template.format(
+            name=patch["name"].rstrip(),
+            bank=program["bank"],
+            prog=program["prog"],
+        )[: memory.PatchStore.NAME]
+        yield program
+
+
+def transform(
+    programs,
+    banks=None,
+    to_bank: int = None,
+    assignments: dict = None,
+    template: str = None,
+):
+    """chain the requested stages onto a stream of programs"""
+    if banks:
+        programs = select_banks(programs, banks)
+    if to_bank is not None:
+        programs = move_to_bank(programs, to_bank)
+    if assignments:
+        programs = set_parameters(programs, assignments)
+    if template:
+        programs = rename(programs, template)
+    return programs
+
+
+def merge(*streams):
+    """programs of all streams, later streams replacing equal slots"""
+    slots = {}
+    for programs in streams:
+        for program in programs:
+            slots[program["bank"], program["prog"]] = program
+    return (slots[slot] for slot in sorted(slots))
+
+
+def convert(source: str, destination: str, options: dict) -> tuple:
+    """convert one file, returns (programs, seconds). runs in a worker."""
+    start = perf_counter()
+    count = write_programs(
+        destination, transform(read_programs(source), **options)
+    )
+    return count, perf_counter() - start
+
+
+def split(source: str, destinations: dict, options: dict) -> tuple:
+    """write every bank of a file to destinations[bank], as convert"""
+    start = perf_counter()
+    count = 0
+    programs = sorted(
+        transform(read_programs(source), **options), key=itemgetter("bank")
+    )
+    for bank, group in groupby(programs, key=itemgetter("bank")):
+        count += write_programs(destinations[bank], group)
+    return count, perf_counter() - start
+
+
+def read_all(source: str) -> list:
+    return list(read_programs(source))
+
+
+def run(function, jobs: list, workers: int = None):
+    """run (function, *arguments) jobs on all cores
+
+    yields (job, result) in the order of 'jobs'
+    """
+    # the process pool machinery is only loaded when there are files to share
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = min(workers or os.cpu_count() or 1, len(jobs)) or 1
+    if workers == 1:
+        for job in jobs:
+            yield job, function(*job)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        yield from zip(jobs, pool.map(function, *zip(*jobs)))
+
+
+def programs_per_second(count: int, seconds: float) -> float:
+    return count / seconds if seconds else float("inf")
@@ -0,0 +1,179 @@
+"""messages per second of evolver.serialize and evolver.receive_sysex
+
+compares the dispatch tables against the structural pattern matching they
+replaced, on the same inputs. legacy_serialize and legacy_receive_sysex are
+the replaced functions verbatim, they find their helpers and the dict they
+called 'memory' among the names below. run from the repository root:
+
+    python -m benchmarks.dispatch
+"""
+
+import logging
+import timeit
+
+import evolver
+import memory as memories
+import parameters
+import utils
+from evolver import Length, Parameter, Partition, Request, assemble
+from evolver import log, serialize_program
+
+memory = {"main": memories.main, "edit": memories.edit}
+
+
+def legacy_serialize(data: list) -> tuple:
+    match data:
+        case [Partition.PROGRAM, bank, program]:
+            return bytes(
+                [
+                    Partition.PROGRAM.value,
+                    bank,
+                    program,
+                    *serialize_program(memory.get("edit")),
+                ]
+            )
+        case [Partition.PROGRAM, bank, prog, *part] if (
+            len(part) == Length.PROGRAM
+        ):
+            return Partition.PROGRAM.value, bank, prog, *part
+        case [Partition.EDIT, *part] if len(part) == Length.PROGRAM:
+            return Partition.EDIT.value, *part
+        case [Partition.WAVESHAPE, n, *part] if len(part) == Length.WAVESHAPE:
+            return Partition.WAVESHAPE.value, n, *part
+        case [Partition.MAIN, *part] if len(part) == Length.MAIN:
+            return Partition.MAIN.value, *part
+        case [Partition.NAME, bank, program, *part] if len(part) == Length.NAME:
+            return Partition.NAME.value, bank, program, *part
+        case [Partition.NAME, *part] if len(part) == Length.NAME:
+            return (
+                Partition.NAME.value,
+                memory["main"]["bank"],
+                memory["main"]["program"],
+                *part,
+            )
+        case [Request.PROGRAM, bank, program]:
+            return Request.PROGRAM.value, bank, program
+        case [Request.PROGRAM]:
+            return (
+                Request.PROGRAM.value,
+                memory["main"]["bank"],
+                memory["main"]["program"],
+            )
+        case [Request.EDIT]:
+            return (Request.EDIT.value,)
+        case [Request.WAVESHAPE, n]:
+            return Request.WAVESHAPE.value, n
+        case [Request.MAIN]:
+            return (Request.MAIN.value,)
+        case [Request.NAME, bank, program]:
+            return Request.NAME.value, bank, program
+        case [Request.NAME]:
+            return (
+                Request.NAME.value,
+                memory["main"]["bank"],
+                memory["main"]["program"],
+            )
+        case [Parameter.PROGRAM, str(par), val]:
+            return (
+                Parameter.PROGRAM.value,
+                parameters.program.index(par),
+                *utils.encode_nibble(val),
+            )
+        case [Parameter.PROGRAM, par, val]:
+            return Parameter.PROGRAM.value, par, *utils.encode_nibble(val)
+        case [Parameter.SEQUENCER, step, val]:
+            return Parameter.SEQUENCER.value, step, *utils.encode_nibble(val)
+        case _:
+            log.warning(f"unknown command: {data=}")
+            return None
+
+
+def legacy_receive_sysex(data: tuple):
+    match data:
+        case [Partition.PROGRAM, bank, prog, *part]:
+            return {"bank": bank, "prog": prog, "patch": assemble(part)}
+        case [Partition.EDIT, *part]:
+            return {"edit": assemble(part)}
+        case [Partition.WAVESHAPE, wave, *part]:
+            return {"wave": wave, "shape": assemble(part)}
+        case [Partition.MAIN, *part]:
+            return {"main": assemble(part)}
+        case [Partition.NAME, bank, prog, *part]:
+            return {"bank": bank, "prog": prog, "name": assemble(part)}
+
+        case [Parameter.PROGRAM, parameter, ls, ms]:
+            memory["edit"].update(
+                {parameters.program[parameter]: utils.decode_nibble(ls, ms)}
+            )
+        case [Parameter.SEQUENCER, step, ls, ms]:
+            memory.get("edit").get("seq")[step] = utils.decode_nibble(ls, ms)
+        case [Parameter.MAIN, parameter, ls, ms]:
+            memory["main"].update(
+                {parameters.main[parameter]: utils.decode_nibble(ls, ms)}
+            )
+
+        case _:
+            log.warning(f"received unknown: {data=}")
+
+
+def outgoing() -> list:
+    """a knob sweep, by number and by name, with dumps and requests"""
+    messages = [(Parameter.PROGRAM, n % 128, n % 256) for n in range(800)] + [
+        (Parameter.PROGRAM, parameters.program[n % 128], n % 256)
+        for n in range(200)
+    ]
+    messages += [(Parameter.SEQUENCER, n % 64, n % 100) for n in range(200)]
+    program = (Partition.PROGRAM, 0, 1, *bytes(Length.PROGRAM))
+    name = (Partition.NAME, *b"benchmark       ")
+    messages += [
+        program,
+        name,
+        (Request.PROGRAM, 1, 2),
+        (Request.PROGRAM,),
+        (Request.NAME,),
+        (Request.EDIT,),
+    ] * 20
+    return messages
+
+
+def incoming() -> list:
+    """received parameter changes and program dumps, as mido delivers them"""
+    messages = [
+        (Parameter.PROGRAM, n % 128, n % 16, n // 16 % 16) for n in range(1000)
+    ] + [(Parameter.SEQUENCER, n % 64, n % 16, 0) for n in range(200)]
+    program = (Partition.PROGRAM, 0, 1, *bytes(Length.PROGRAM))
+    name = (Partition.NAME, 0, 1, *b"benchmark       ")
+    messages += [program, name] * 20
+    return messages
+
+
+def rate(function, messages: list, repeat: int = 5) -> float:
+    def run():
+        for message in messages:
+            function(message)
+
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    return len(messages) / best
+
+
+def main():
+    logging.disable(logging.WARNING)
+    for label, legacy, current, messages in (
+        ("serialize", legacy_serialize, evolver.serialize, outgoing()),
+        (
+            "receive_sysex",
+            legacy_receive_sysex,
+            evolver.receive_sysex,
+            incoming(),
+        ),
+    ):
+        before = rate(legacy, messages)
+        after = rate(current, messages)
+        print(
+            f"{label:14} before {before:10.0f} msg/s  "
+            f"after {after:10.0f} msg/s  x{after / before:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""import time of each module, in a fresh interpreter
+
+the offline modules must not load mido (or start a backend) when imported;
+they are checked and the run fails if one does. run from the repository root:
+
+    python -m benchmarks.startup
+"""
+
+import subprocess
+import sys
+
+# modules usable without a midi interface
+offline = ("batch", "cli", "library", "mapping", "memory", "utils", "waveshape")
+online = ("main",)
+
+_probe = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, "mido" in sys.modules)
+"""
+
+
+def import_time(module: str, repeat: int = 5) -> tuple:
+    """best import time in seconds, and whether mido was loaded"""
+    best, loaded = float("inf"), False
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", _probe.format(module=module)],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.split()
+        best = min(best, float(output[0]))
+        loaded = output[1] == "True"
+    return best, loaded
+
+
+def main():
+    failed = []
+    for module in offline + online:
+        try:
+            seconds, loaded = import_time(module)
+        except subprocess.CalledProcessError as error:
+            print(
+                f"{module:10} failed: {error.stderr.strip().splitlines()[-1]}"
+            )
+            continue
+        print(f"{module:10} {seconds * 1000:8.1f} ms  mido: {loaded}")
+        if loaded and module in offline:
+            failed.append(module)
+    if failed:
+        sys.exit(f"mido imported by offline modules: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""benchmarks of the codec, decode and persistence hot paths
+
+every case runs on fixed data: synthetic bytes from a seeded generator,
+the bundled program_memory.json and the shapes in waveshapes/. reports
+operations and bytes per second, and from tracemalloc the peak memory of
+one operation and the blocks each operation leaves allocated. run from the
+repository root:
+
+    python -m benchmarks.suite [-k NAME] [--save FILE] [--baseline FILE]
+
+every rate is the median of several runs, and is also reported relative
+to a fixed pure python workload timed alongside, so runs on different
+machines or under different load compare. with --baseline the relative
+rates are compared to those of an earlier --save, cases more than
+--tolerance slower are flagged and the run fails. benchmarks/baseline.json
+was taken on one machine, a reference for --baseline rather than a gate;
+--update-baseline rewrites it.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+import evolver
+import memory
+import utils
+import waveshape
+from evolver import Parameter, Partition
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+PROGRAMS = "program_memory.json"
+WAVESHAPES = "waveshapes"
+SEED = 2024
+
+
+def cases(directory: str) -> list:
+    """(name, function, arguments, bytes per operation) of every case"""
+    rng = random.Random(SEED)
+    program = bytes(rng.randrange(128) for _ in range(192))
+    packed = utils.pack_msbit(program)
+    shape = bytes(rng.randrange(256) for _ in range(waveshape.SIZE))
+    packed_shape = evolver.serialize_waveshape(shape)
+    main = bytes(rng.randrange(128) for _ in range(16))
+    nibbles = utils.encode_nibbles(main)
+    name = b"benchmark name  "
+
+    programs = utils.load_json(PROGRAMS)
+    store = memory.PatchStore.from_dict(programs)
+    patch = store.as_dict(0, 0)
+    bank = waveshape.WaveshapeBank.load_directory(WAVESHAPES)
+    wire = dict(enumerate(bank.to_wire()))
+    json_file = os.path.join(directory, "programs.json")
+    json_size = os.path.getsize(PROGRAMS)
+
+    program_message = (Partition.PROGRAM, 0, 1, *packed)
+    parameter_message = (Parameter.PROGRAM, 20, *utils.encode_nibble(99))
+    return [
+        ("pack_msbit program", utils.pack_msbit, (program,), len(program)),
+        ("unpack_msbit program", utils.unpack_msbit, (packed,), len(packed)),
+        ("pack_msbit waveshape", utils.pack_msbit, (shape,), len(shape)),
+        (
+            "unpack_msbit waveshape",
+            utils.unpack_msbit,
+            (packed_shape,),
+            len(packed_shape),
+        ),
+        ("unpack_nibbles main", utils.unpack_nibbles, (nibbles,), len(nibbles)),
+        ("serialize_program", evolver.serialize_program, (patch,), 192),
+        ("assemble program", evolver.assemble, (packed,), len(packed)),
+        (
+            "assemble waveshape",
+            evolver.assemble,
+            (packed_shape,),
+            len(packed_shape),
+        ),
+        ("assemble main", evolver.assemble, (nibbles,), len(nibbles)),
+        ("assemble name", evolver.assemble, (name,), len(name)),
+        (
+            "receive_sysex program",
+            evolver.receive_sysex,
+            (program_message,),
+            len(program_message),
+        ),
+        (
+            "receive_sysex parameter",
+            evolver.receive_sysex,
+            (parameter_message,),
+            len(parameter_message),
+        ),
+        ("load_json programs", utils.load_json, (PROGRAMS,), json_size),
+        (
+            "save_json programs",
+            utils.save_json,
+            (json_file, programs),
+            json_size,
+        ),
+        ("PatchStore.to_dict", store.to_dict, (), len(store.buffer)),
+        (
+            "serialize_waveshape",
+            evolver.serialize_waveshape,
+            (bank[1],),
+            waveshape.SIZE,
+        ),
+        (
+            "WaveshapeBank.to_wire",
+            bank.to_wire,
+            (),
+            waveshape.SHAPES * waveshape.SIZE,
+        ),
+        (
+            "WaveshapeBank.from_wire",
+            waveshape.WaveshapeBank().from_wire,
+            (wire,),
+            waveshape.SHAPES * evolver.Length.WAVESHAPE,
+        ),
+    ]
+
+
+def _calibration():
+    """a fixed workload of plain bytecode, the unit of relative rates"""
+    total = 0
+    for n in range(1000):
+        total += n & 0x7F
+    return total
+
+
+def rate(function, arguments: tuple, repeat: int = 9) -> tuple:
+    """(operations per second, the same relative to _calibration)
+
+    medians over 'repeat' runs of about 0.2s, each run right after one of
+    the calibration so that both see the same machine load
+    """
+    timer = timeit.Timer(lambda: function(*arguments))
+    unit = timeit.Timer(_calibration)
+    number, _ = timer.autorange()
+    units, _ = unit.autorange()
+    rates, relative = [], []
+    for _ in range(repeat):
+        units_per_second = units / unit.timeit(units)
+        rates.append(number / timer.timeit(number))
+        relative.append(rates[-1] / units_per_second)
+    return statistics.median(rates), statistics.median(relative)
+
+
+def allocations(function, arguments: tuple, number: int = 20) -> tuple:
+    """(peak bytes of one operation, blocks left allocated per operation)"""
+    function(*arguments)
+    results = [None] * number
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        results[0] = function(*arguments)
+        _, peak = tracemalloc.get_traced_memory()
+        for n in range(1, number):
+            results[n] = function(*arguments)
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(
+        difference.count_diff
+        for difference in after.compare_to(before, "filename")
+        if difference.count_diff > 0
+    )
+    del results
+    return peak - start, blocks / number
+
+
+def _nothing():
+    pass
+
+
+def run(selected: str = None) -> dict:
+    results = {}
+    # blocks the measurement itself leaves, taken off every case
+    _, overhead = allocations(_nothing, ())
+    with tempfile.TemporaryDirectory() as directory:
+        for name, function, arguments, size in cases(directory):
+            if selected and selected not in name:
+                continue
+            operations, relative = rate(function, arguments)
+            peak, retained = allocations(function, arguments)
+            retained = max(0.0, retained - overhead)
+            results[name] = {
+                "ops_per_second": operations,
+                "relative_rate": relative,
+                "bytes_per_second": operations * size,
+                "peak_bytes": peak,
+                "retained_blocks_per_op": retained,
+            }
+            print(
+                f"{name:26} {operations:12.0f} ops/s "
+                f"{operations * size / 1e6:9.2f} MB/s "
+                f"{peak:9} peak B {retained:8.1f} retained blocks/op"
+            )
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """names of cases slower than the baseline by more than 'tolerance',
+    on rates relative to the calibration workload"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None or "relative_rate" not in before:
+            continue
+        ratio = result["relative_rate"] / before["relative_rate"]
+        flag = "REGRESSION" if ratio < 1.0 - tolerance else ""
+        print(f"{name:26} x{ratio:5.2f} of baseline {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def _write(filename: str, report: dict):
+    with open(filename, "w") as file:
+        json.dump(report, file, indent=2)
+        file.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite")
+    parser.add_argument("-k", dest="selected", help="only cases named like")
+    parser.add_argument("--save", help="write the results to a json file")
+    parser.add_argument("--baseline", help="results to compare to")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.3, help="allowed slowdown"
+    )
+    parser.add_argument(
+        "--update-baseline", action="store_true", help="write the baseline"
+    )
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seed": SEED,
+        "results": run(args.selected),
+    }
+    if args.save:
+        _write(args.save, report)
+    if args.update_baseline:
+        _write(args.baseline or BASELINE, report)
+    elif args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(report["results"], baseline, args.tolerance)
+        if regressions:
+            sys.exit(
+                f"{len(regressions)} regressions: {', '.join(regressions)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
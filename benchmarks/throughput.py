@@ -0,0 +1,117 @@
+"""backup, sync and scheduler throughput against a virtual evolver
+
+the virtual evolver keeps to the wire time of 31.25 kbaud, so the numbers
+are those to expect from the hardware. --speed runs the wire faster for a
+quick check. run from the repository root:
+
+    python -m benchmarks.throughput [--banks 1] [--speed 1]
+"""
+
+import argparse
+import asyncio
+import logging
+from time import perf_counter
+
+from mido import Message
+
+import backup
+import config
+import engine
+import evolver
+import memory
+import sync
+import virtual
+from evolver import Parameter
+from scheduler import OutputScheduler
+
+
+def test_store(banks: int) -> memory.PatchStore:
+    store = memory.PatchStore(banks)
+    for n, (bank, prog) in enumerate(store):
+        store.program(bank, prog)[:] = bytes(
+            (n + p) % 100 for p in range(store.PARAMETERS)
+        )
+        store.set_name(bank, prog, f"program {bank}-{prog}")
+    return store
+
+
+async def run_backup(banks: int, rate: int) -> dict:
+    device = virtual.VirtualEvolver(test_store(banks), bytes_per_second=rate)
+    async with engine.AsyncEvolver(device, bytes_per_second=rate) as midi:
+        device.listener = midi.feed
+        report = await backup.backup(midi, memory.PatchStore(banks))
+    device.close()
+    return report
+
+
+def run_sync(banks: int, rate: int) -> tuple:
+    """seconds until a full sync has arrived, and the bytes sent"""
+    device = virtual.VirtualEvolver(bytes_per_second=rate)
+    scheduler = OutputScheduler(device, rate)
+    scheduler.start()
+    start = perf_counter()
+    sync.sync(
+        lambda *data: scheduler.put(
+            Message(
+                type="sysex",
+                data=(*evolver.sysex_id, *evolver.serialize(data)),
+            )
+        ),
+        test_store(banks),
+        {},
+    )
+    scheduler.close()
+    device.close()
+    return perf_counter() - start, device.received_bytes
+
+
+def run_scheduler(changes: int, rate: int) -> dict:
+    """a sweep of parameter changes, most of them coalesced"""
+    device = virtual.VirtualEvolver(bytes_per_second=rate)
+    scheduler = OutputScheduler(device, rate)
+    scheduler.start()
+    for n in range(changes):
+        scheduler.put(
+            Message(
+                type="sysex",
+                data=(
+                    *evolver.sysex_id,
+                    *evolver.serialize((Parameter.PROGRAM, n % 64, n % 100)),
+                ),
+            )
+        )
+    scheduler.close()
+    device.close()
+    return scheduler.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--banks", type=int, default=1)
+    parser.add_argument("--speed", type=float, default=1.0)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    rate = round(config.midi_bytes_per_second * args.speed)
+
+    report = asyncio.run(run_backup(args.banks, rate))
+    programs = args.banks * 128
+    print(
+        f"backup     {programs / report['seconds']:8.1f} programs/s  "
+        f"p50 {report['latency']['p50'] * 1000:.1f} ms  "
+        f"{len(report['failed'])} failed"
+    )
+    seconds, size = run_sync(args.banks, rate)
+    print(
+        f"sync       {programs / seconds:8.1f} programs/s  "
+        f"{size / seconds:8.0f} bytes/s"
+    )
+    stats = run_scheduler(2000, rate)
+    print(
+        f"scheduler  {stats['messages_per_second']:8.1f} messages/s  "
+        f"{stats['bytes_per_second']:8.0f} bytes/s  "
+        f"{stats['coalesced']} coalesced"
+    )
+
+
+if __name__ == "__main__":
+    main()
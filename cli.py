@@ -0,0 +1,232 @@
+"""evolute - command line tools
+
+python cli.py waveshapes [options] FILE...
+python cli.py convert [options] FILE...       (.json, .syx and .evl files)
+python cli.py split [options] FILE...
+python cli.py merge [options] -o OUTPUT FILE...
+
+convert, split and merge take --bank, --to-bank, --set parameter=value and
+--rename "{name:.12} {prog:03}" to edit the programs on the way through.
+convert needs -o, -d or --to for its output, or --in-place to rewrite its
+inputs, also when the output it is given is the input itself.
+"""
+
+import argparse
+import os
+from time import perf_counter
+
+
+def import_waveshapes(args: argparse.Namespace):
+    import memory
+    import utils
+    import waveshape
+
+    if args.first not in range(waveshape.SHAPES):
+        raise SystemExit(f"evolute: --first must be 0-{waveshape.SHAPES - 1}")
+    if len(args.files) > waveshape.SHAPES - args.first:
+        raise SystemExit(
+            f"evolute: {len(args.files)} files do not fit in slots "
+            f"{args.first}-{waveshape.SHAPES - 1}"
+        )
+    if os.path.isdir(args.directory):
+        bank = waveshape.WaveshapeBank.load_directory(args.directory)
+    else:
+        bank = waveshape.WaveshapeBank()
+    start = perf_counter()
+    converted = {}
+    for slot, filename, payload, seconds in waveshape.convert_files(
+        args.files, bank, args.first, args.workers, not args.no_normalize
+    ):
+        converted[slot] = bank[slot]
+        print(f"{slot:3} {seconds * 1000:8.1f} ms  {filename}")
+    bank.save_directory(args.directory)
+    if args.syx:
+        utils.save_sysex(args.syx, memory.PatchStore(0), converted)
+    elapsed = perf_counter() - start
+    print(f"{len(converted)} waveshapes in {elapsed:.2f}s")
+
+
+def _options(args: argparse.Namespace) -> dict:
+    import batch
+
+    try:
+        for filename in (*args.files, *filter(None, [args.output])):
+            batch.file_format(filename)
+        assignments = dict(map(batch.parse_assignment, args.set))
+    except ValueError as error:
+        raise SystemExit(f"evolute: {error}")
+    return {
+        "banks": args.bank,
+        "to_bank": args.to_bank,
+        "assignments": assignments,
+        "template": args.rename,
+    }
+
+
+def _output(filename: str, args: argparse.Namespace, suffix: str = "") -> str:
+    stem, extension = os.path.splitext(os.path.basename(filename))
+    directory = args.directory or os.path.dirname(filename)
+    return os.path.join(directory, f"{stem}{suffix}.{args.to or extension[1:]}")
+
+
+def _same_file(source: str, destination: str) -> bool:
+    if os.path.exists(destination):
+        return os.path.samefile(source, destination)
+    return os.path.abspath(source) == os.path.abspath(destination)
+
+
+def _report(results, start: float):
+    import batch
+
+    total = 0
+    for (source, *_), (count, seconds) in results:
+        total += count
+        rate = batch.programs_per_second(count, seconds)
+        print(f"{count:5} programs {rate:10.0f} programs/s  {source}")
+    elapsed = perf_counter() - start
+    rate = batch.programs_per_second(total, elapsed)
+    print(f"{total} programs in {elapsed:.2f}s, {rate:.0f} programs/s")
+
+
+def convert_programs(args: argparse.Namespace):
+    import batch
+
+    options = _options(args)
+    if args.output and len(args.files) > 1:
+        raise SystemExit("evolute: --output takes one input, use merge")
+    if args.in_place == bool(args.output or args.directory or args.to):
+        raise SystemExit(
+            "evolute: convert needs either -o, -d or --to, or --in-place"
+        )
+    jobs = [
+        (source, args.output or _output(source, args), options)
+        for source in args.files
+    ]
+    if not args.in_place:
+        for source, destination, _ in jobs:
+            if _same_file(source, destination):
+                raise SystemExit(
+                    f"evolute: {destination} is an input, add --in-place"
+                )
+    if args.directory:
+        os.makedirs(args.directory, exist_ok=True)
+    start = perf_counter()
+    _report(batch.run(batch.convert, jobs, args.workers), start)
+
+
+def split_programs(args: argparse.Namespace):
+    import batch
+
+    options = _options(args)
+    if args.directory:
+        os.makedirs(args.directory, exist_ok=True)
+    start = perf_counter()
+    jobs = [
+        (
+            source,
+            {
+                bank: _output(source, args, f"-bank{bank + 1}")
+                for bank in range(4)
+            },
+            options,
+        )
+        for source in args.files
+    ]
+    _report(batch.run(batch.split, jobs, args.workers), start)
+
+
+def merge_programs(args: argparse.Namespace):
+    import batch
+
+    options = _options(args)
+    start = perf_counter()
+    jobs = [(source,) for source in args.files]
+    streams = [
+        programs
+        for _, programs in batch.run(batch.read_all, jobs, args.workers)
+    ]
+    count = batch.write_programs(
+        args.output, batch.transform(batch.merge(*streams), **options)
+    )
+    elapsed = perf_counter() - start
+    rate = batch.programs_per_second(count, elapsed)
+    print(f"{count} programs in {elapsed:.2f}s, {rate:.0f} programs/s")
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="evolute")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    edits = argparse.ArgumentParser(add_help=False)
+    edits.add_argument("files", nargs="+", help=".json, .syx or .evl files")
+    edits.add_argument(
+        "--bank",
+        type=int,
+        action="append",
+        help="only programs of this bank (0-3), repeatable",
+    )
+    edits.add_argument("--to-bank", type=int, help="move programs to a bank")
+    edits.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="PARAMETER=VALUE",
+        help="set a parameter on every program, repeatable",
+    )
+    edits.add_argument(
+        "--rename", metavar="FORMAT", help="name format of name, bank, prog"
+    )
+    edits.add_argument("--workers", type=int, help="worker processes")
+
+    outputs = argparse.ArgumentParser(add_help=False)
+    outputs.add_argument("-d", "--directory", help="output directory")
+    outputs.add_argument(
+        "--to", choices=("json", "syx", "evl"), help="output format"
+    )
+
+    waveshapes = commands.add_parser(
+        "waveshapes", help="convert .wav files to waveshapes"
+    )
+    waveshapes.add_argument("files", nargs="+", help=".wav files to convert")
+    waveshapes.add_argument(
+        "--first", type=int, default=0, help="first waveshape slot to fill"
+    )
+    waveshapes.add_argument(
+        "--directory", default="waveshapes", help="waveshape bank directory"
+    )
+    waveshapes.add_argument("--syx", help="also write the shapes as sysex")
+    waveshapes.add_argument("--workers", type=int, help="worker processes")
+    waveshapes.add_argument(
+        "--no-normalize", action="store_true", help="keep the input level"
+    )
+    waveshapes.set_defaults(run=import_waveshapes)
+
+    convert = commands.add_parser(
+        "convert", parents=(edits, outputs), help="convert and edit programs"
+    )
+    convert.add_argument("-o", "--output", help="output file")
+    convert.add_argument(
+        "--in-place", action="store_true", help="rewrite the input files"
+    )
+    convert.set_defaults(run=convert_programs)
+
+    split = commands.add_parser(
+        "split", parents=(edits, outputs), help="write one file per bank"
+    )
+    split.set_defaults(run=split_programs, output=None)
+
+    merge = commands.add_parser(
+        "merge", parents=(edits,), help="merge files, later ones win"
+    )
+    merge.add_argument("-o", "--output", required=True, help="output file")
+    merge.set_defaults(run=merge_programs)
+    return parser
+
+
+def main(argv: list = None):
+    args = parser().parse_args(argv)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,4 +2,5 @@
 
 midi_in = "MidiKliK 1"
 midi_out = "MidiKliK 2"
-midi_speed = 0.1
+# the evolver's midi input: 31250 baud, 10 bits per byte
+midi_bytes_per_second = 3125
@@ -0,0 +1,184 @@
+# dedup.py
+# exact and near duplicate programs across libraries
+
+import hashlib
+from array import array
+
+import numpy as np
+
+import evolver
+import memory
+import similarity
+
+BANDS = 16
+# continuous parameters are compared in this many steps over their range
+LEVELS = 32
+# members of a bucket each program is compared with, this bounds the
+# time spent on very large buckets (e.g. many programs with an empty band)
+BUCKET_WINDOW = 1024
+_PLACEHOLDERS = ("unknown", "default_name", "init")
+
+
+class Dedup:
+    """find duplicate programs in one pass over any number of stores
+
+    exact duplicates have the same serialized program bytes, names are not
+    compared. near duplicates differ in at most 'max_differences' of the
+    128 parameters, after quantizing continuous parameters to LEVELS steps:
+    every program is cut into BANDS bands of 8 quantized parameters, each
+    one a 64-bit key. the bands form max_differences + 1 disjoint groups
+    and programs that share all keys of a group are candidates
+    (locality-sensitive hashing by parameter sampling). near duplicates
+    differ in at most max_differences bands, so they share a group and are
+    found, unless its bucket holds more than BUCKET_WINDOW programs between
+    them. the widest groups that allow this keep the buckets small. memory
+    per program is its location, a digest, 128 quantized bytes and the band
+    keys.
+    """
+
+    def __init__(self, max_differences: int = 4):
+        if max_differences >= BANDS:
+            raise ValueError(f"{max_differences=}. should be below {BANDS}.")
+        self.max_differences = max_differences
+        self.features = similarity.Features()
+        # a fixed permutation spreads parameters of a section over the bands
+        self.order = np.random.default_rng(0).permutation(128)
+        self.locations = []
+        self.digests = {}
+        # first program with the same bytes, and the union-find parents
+        self.copies = array("q")
+        self.parents = array("q")
+        # programs that are not exact copies, in the order of 'quantized'
+        self.unique = array("q")
+        self.quantized = bytearray()
+        self.keys = []
+
+    def find(self, n: int) -> int:
+        parents = self.parents
+        while parents[n] != n:
+            parents[n] = parents[parents[n]]
+            n = parents[n]
+        return n
+
+    def union(self, a: int, b: int):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parents[max(a, b)] = min(a, b)
+
+    def add(self, store: memory.PatchStore, source: str = ""):
+        """hash every program of 'store'"""
+        first = len(self.locations)
+        programs, _ = similarity.store_arrays(store)
+        new = []
+        for n, (b, p) in enumerate(store, first):
+            self.locations.append((source, b, p, store.name(b, p)))
+            data = evolver.serialize_program(store.as_dict(b, p))
+            digest = hashlib.blake2b(data, digest_size=16).digest()
+            original = self.digests.setdefault(digest, n)
+            self.copies.append(original)
+            self.parents.append(original)
+            if original == n:
+                new.append(n - first)
+        if not new:
+            return
+        vectors, codes = self.features(programs[new])
+        steps = np.minimum(vectors * LEVELS, LEVELS - 1).astype(np.uint8)
+        quantized = np.ascontiguousarray(
+            np.hstack((steps, codes))[:, self.order]
+        )
+        self.quantized += quantized.tobytes()
+        self.unique.extend(n + first for n in new)
+        self.keys.append(quantized.view(np.uint64))
+
+    def clusters(self) -> list:
+        """groups of duplicate programs with a representative of each
+
+        returns dicts with the 'representative' location, all 'members' and
+        whether they are all 'exact' copies, largest groups first
+        """
+        if self.keys:
+            keys = np.concatenate(self.keys)
+            rows = np.frombuffer(self.quantized, dtype=np.uint8).reshape(
+                -1, 128
+            )
+            unique = np.frombuffer(self.unique, dtype=np.int64)
+            width = BANDS // (self.max_differences + 1)
+            for group in range(self.max_differences + 1):
+                self._compare_group(
+                    keys[:, group * width : (group + 1) * width], unique, rows
+                )
+        groups = {}
+        for n in range(len(self.locations)):
+            groups.setdefault(self.find(n), []).append(n)
+        result = [
+            {
+                "representative": self.locations[self.representative(members)],
+                "members": [self.locations[n] for n in members],
+                "exact": len({self.copies[n] for n in members}) == 1,
+            }
+            for members in groups.values()
+            if len(members) > 1
+        ]
+        result.sort(key=lambda cluster: -len(cluster["members"]))
+        return result
+
+    def roots(self) -> np.ndarray:
+        """union-find root of every program"""
+        roots = np.frombuffer(self.parents, dtype=np.int64).copy()
+        # parents always point to a smaller index, so pointer jumping ends
+        while True:
+            jumped = roots[roots]
+            if (jumped == roots).all():
+                return roots
+            roots = jumped
+
+    def _compare_group(self, columns, unique, rows):
+        """join near duplicates among the programs sharing the band keys
+        'columns' of a group
+
+        only buckets that still hold more than one cluster are compared,
+        so after the first group most buckets of near duplicates are
+        skipped without looking at their rows
+        """
+        roots = self.roots()[unique]
+        # programs sharing the keys form a run, ordered by root within it
+        order = np.lexsort((roots, *columns.T[::-1]))
+        columns, roots = columns[order], roots[order]
+        same = (columns[1:] == columns[:-1]).all(axis=1)
+        starts = np.concatenate(([True], ~same))
+        run = np.cumsum(starts) - 1
+        ends = np.append(np.flatnonzero(starts)[1:], len(columns))
+        starts = np.flatnonzero(starts)
+        mixed = np.unique(run[1:][same & (roots[1:] != roots[:-1])])
+        for m in mixed.tolist():
+            start, end = starts[m], ends[m]
+            self._compare(order[start:end], rows, roots[start:end].copy())
+
+    def _compare(self, bucket: np.ndarray, rows: np.ndarray, roots):
+        """join the programs of a bucket that are near duplicates
+
+        every member is compared with the later ones (the next BUCKET_WINDOW
+        of them in larger buckets) that are not yet in its cluster. 'roots'
+        are the members' clusters, kept up to date as they are joined.
+        """
+        block = rows[bucket]
+        for i in range(len(bucket) - 1):
+            window = slice(i + 1, i + 1 + BUCKET_WINDOW)
+            others = np.flatnonzero(roots[window] != roots[i]) + i + 1
+            if not len(others):
+                continue
+            differences = np.count_nonzero(block[others] != block[i], axis=1)
+            for j in others[differences <= self.max_differences].tolist():
+                if roots[j] == roots[i]:
+                    continue
+                self.union(self.unique[bucket[i]], self.unique[bucket[j]])
+                joined = min(roots[i], roots[j])
+                roots[(roots == roots[i]) | (roots == roots[j])] = joined
+
+    def representative(self, members: list) -> int:
+        """first member with a real name, or the first member"""
+        for n in members:
+            name = self.locations[n][3].strip().lower()
+            if not name.startswith(_PLACEHOLDERS):
+                return n
+        return members[0]
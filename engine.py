@@ -0,0 +1,203 @@
+# engine.py
+# asyncio midi engine
+
+import asyncio
+
+from mido import Message
+
+import config
+import evolver
+import utils
+from evolver import Partition, Request
+
+log = utils.get_logger("engine")
+log.setLevel(20)
+
+
+# number of leading bytes of a partition that identify the reply
+_REPLY_HEADER = {
+    Partition.PROGRAM: 3,
+    Partition.EDIT: 1,
+    Partition.WAVESHAPE: 2,
+    Partition.MAIN: 1,
+    Partition.NAME: 3,
+}
+
+
+def reply_key(data: tuple) -> tuple | None:
+    """key that matches a received partition to the request for it"""
+    size = _REPLY_HEADER.get(data[0]) if data else None
+    return tuple(data[:size]) if size else None
+
+
+class AsyncEvolver:
+    """talk to the evolver from a single asyncio event loop
+
+    incoming messages are handed over by 'feed', which may be called from
+    the midi backend's callback thread. outgoing sysex is paced to
+    'bytes_per_second'. the request_* coroutines resolve with the decoded
+    reply, so any number of requests can be outstanding at once.
+    """
+
+    def __init__(
+        self,
+        output,
+        bytes_per_second: int = config.midi_bytes_per_second,
+        on_receive=None,
+    ):
+        self.output = output
+        self.bytes_per_second = bytes_per_second
+        self.on_receive = on_receive
+        self.loop = None
+        self.inbox = None
+        self.outbox = None
+        self.waiters = {}
+        self.tasks = ()
+
+    @classmethod
+    async def connect(
+        cls,
+        input_name: str = config.midi_in,
+        output_name: str = config.midi_out,
+    ) -> "AsyncEvolver":
+        engine = cls(utils.open_output(output_name))
+        await engine.start()
+        engine.input = utils.open_input(input_name, callback=engine.feed)
+        return engine
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.inbox = asyncio.Queue()
+        self.outbox = asyncio.Queue()
+        self.tasks = (
+            asyncio.create_task(self.read()),
+            asyncio.create_task(self.write()),
+        )
+
+    async def close(self):
+        # a stopped writer leaves the outbox as it is, do not wait for it
+        if self.tasks and not self.tasks[1].done():
+            await self.outbox.join()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def feed(self, message: Message):
+        """hand over a received message, safe to call from any thread"""
+        self.loop.call_soon_threadsafe(self.inbox.put_nowait, message)
+
+    async def read(self):
+        try:
+            while True:
+                message = await self.inbox.get()
+                if message.type != "sysex":
+                    continue
+                if tuple(message.data[:3]) != evolver.sysex_id:
+                    log.warning(f"received foreign sysex: {message}")
+                    continue
+                try:
+                    self.receive(message.data[3:])
+                except Exception:
+                    # a malformed message must not stop the reader
+                    log.exception(f"cannot decode {message}")
+        finally:
+            self.fail_waiters(RuntimeError("midi reader stopped"))
+
+    def fail_waiters(self, error: Exception):
+        """end all outstanding requests with 'error'"""
+        waiters, self.waiters = self.waiters, {}
+        for futures in waiters.values():
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
+
+    def receive(self, data: tuple):
+        result = evolver.receive_sysex(tuple(data))
+        waiters = self.waiters.pop(reply_key(data), ())
+        for future in waiters:
+            if not future.done():
+                future.set_result(result)
+        if not waiters and self.on_receive is not None:
+            self.on_receive(result)
+
+    async def write(self):
+        try:
+            while True:
+                message = await self.outbox.get()
+                try:
+                    self.output.send(message)
+                    if message.type == "sysex":
+                        size = len(message.bytes())
+                        await asyncio.sleep(size / self.bytes_per_second)
+                except Exception:
+                    # like the reader, carry on with the next message
+                    log.exception(f"cannot send {message}")
+                finally:
+                    self.outbox.task_done()
+        finally:
+            self.fail_waiters(RuntimeError("midi writer stopped"))
+
+    def send(self, *data):
+        """serialize and queue a sysex message"""
+        self.outbox.put_nowait(
+            Message(
+                type="sysex",
+                data=(*evolver.sysex_id, *evolver.serialize(data)),
+            )
+        )
+
+    async def request(self, key: tuple, *data, timeout: float = None):
+        """send request 'data' and wait for the partition matching 'key'"""
+        if any(task.done() for task in self.tasks):
+            raise RuntimeError("midi reader or writer stopped")
+        future = self.loop.create_future()
+        self.waiters.setdefault(key, []).append(future)
+        self.send(*data)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            waiters = self.waiters.get(key, [])
+            if future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self.waiters[key]
+
+    async def request_program(self, bank: int, program: int, timeout=None):
+        return await self.request(
+            (Partition.PROGRAM, bank, program),
+            Request.PROGRAM,
+            bank,
+            program,
+            timeout=timeout,
+        )
+
+    async def request_name(self, bank: int, program: int, timeout=None):
+        return await self.request(
+            (Partition.NAME, bank, program),
+            Request.NAME,
+            bank,
+            program,
+            timeout=timeout,
+        )
+
+    async def request_waveshape(self, n: int, timeout=None):
+        return await self.request(
+            (Partition.WAVESHAPE, n), Request.WAVESHAPE, n, timeout=timeout
+        )
+
+    async def request_edit(self, timeout=None):
+        return await self.request(
+            (Partition.EDIT,), Request.EDIT, timeout=timeout
+        )
+
+    async def request_main(self, timeout=None):
+        return await self.request(
+            (Partition.MAIN,), Request.MAIN, timeout=timeout
+        )
@@ -0,0 +1,203 @@
+# evolve.py
+# genetic evolution of programs
+#
+# a population is an (n, 192) uint8 matrix, one row per program: the 128
+# program parameters followed by the 64 sequencer steps. every gene only
+# takes values of its mapping table.
+
+import numpy as np
+
+import mapping
+import memory
+import morph
+import similarity
+
+PARAMETERS = memory.PatchStore.PARAMETERS
+STEPS = memory.PatchStore.STEPS
+GENES = PARAMETERS + STEPS
+# only the steps of sequence 1 may rest
+RESTING_STEPS = 16
+
+
+def _step_tables() -> list:
+    playing = mapping.make_mapping(
+        [mapping.seq_step[n] for n in range(max(mapping.seq_step))]
+    )
+    return [mapping.seq_step] * RESTING_STEPS + [playing] * (
+        STEPS - RESTING_STEPS
+    )
+
+
+class Genome:
+    """legal values of every gene, as lookup tables
+
+    'nearest[g, v]' is the legal value of gene g closest to v, 'keys[g]'
+    its legal values in order (padded with the last one) of which there
+    are 'counts[g]'.
+    """
+
+    def __init__(self):
+        tables = [*mapping.program, *_step_tables()]
+        self.nearest = morph.nearest_table(tables)
+        self.legal = np.zeros((GENES, 256), dtype=bool)
+        self.keys = np.empty((GENES, 256), dtype=np.uint8)
+        self.counts = np.empty(GENES, dtype=np.int64)
+        for g, table in enumerate(tables):
+            keys = sorted(table)
+            self.legal[g, keys] = True
+            self.keys[g] = keys + keys[-1:] * (256 - len(keys))
+            self.counts[g] = len(keys)
+        self.low = self.keys[:, 0].astype(np.float32)
+        self.span = (
+            self.keys[np.arange(GENES), self.counts - 1] - self.keys[:, 0]
+        ).astype(np.float32)
+        self.categorical = np.zeros(GENES, dtype=bool)
+        self.categorical[:PARAMETERS] = morph.categorical_mask()
+        self._genes = np.arange(GENES)
+
+    def random(self, size: int, rng: np.random.Generator) -> np.ndarray:
+        """'size' programs of uniformly chosen legal values"""
+        choice = (rng.random((size, GENES)) * self.counts).astype(np.int64)
+        return self.keys[self._genes, choice]
+
+    def clamp(self, population: np.ndarray) -> np.ndarray:
+        """every gene moved to its nearest legal value"""
+        return self.nearest[self._genes, population]
+
+    def is_legal(self, population: np.ndarray) -> np.ndarray:
+        """bool per program, True if all its genes are legal"""
+        return self.legal[self._genes, population].all(axis=1)
+
+
+class Population:
+    """programs that breed by crossover and mutation
+
+    'fitness' maps an (n, 192) matrix to n scores, higher is better.
+    without it survivors are drawn at random, a randomizer seeded by the
+    initial programs.
+    """
+
+    def __init__(
+        self,
+        genes: np.ndarray,
+        fitness=None,
+        genome: Genome = None,
+        rng: np.random.Generator = None,
+    ):
+        self.genome = genome or Genome()
+        self.rng = rng or np.random.default_rng()
+        self.genes = self.genome.clamp(np.asarray(genes, dtype=np.uint8))
+        self.fitness = fitness
+        self.scores = None
+        self.generation = 0
+
+    @classmethod
+    def random(cls, size: int, **options) -> "Population":
+        genome = options.pop("genome", None) or Genome()
+        rng = options.pop("rng", None) or np.random.default_rng()
+        return cls(genome.random(size, rng), genome=genome, rng=rng, **options)
+
+    @classmethod
+    def from_store(
+        cls, store: memory.PatchStore, banks=None, **options
+    ) -> "Population":
+        """seed with the programs (and sequences) of some banks of a store"""
+        records = np.frombuffer(store.buffer, dtype=np.uint8).reshape(
+            store.banks, 128, store.RECORD
+        )
+        if banks is not None:
+            records = records[list(banks)]
+        return cls(records.reshape(-1, store.RECORD)[:, :GENES], **options)
+
+    def __len__(self) -> int:
+        return len(self.genes)
+
+    def crossover(self, size: int, blend: float = 0.5) -> np.ndarray:
+        """'size' children of random parent pairs
+
+        each gene comes from the second parent with probability 'blend'
+        """
+        parents = self.rng.integers(0, len(self.genes), (2, size))
+        mask = self.rng.random((size, GENES)) < blend
+        return np.where(mask, self.genes[parents[1]], self.genes[parents[0]])
+
+    def mutate(
+        self, genes: np.ndarray, rate: float = 0.05, amount: float = 0.1
+    ) -> np.ndarray:
+        """change a 'rate' of the genes, clamped to legal values
+
+        continuous genes move by a normal step of 'amount' times their
+        range, categorical ones take a random legal value
+        """
+        genome = self.genome
+        mutated = self.rng.random(genes.shape) < rate
+        steps = self.rng.normal(0.0, amount, genes.shape) * genome.span
+        moved = np.clip(
+            np.rint(genes + steps), genome.low, genome.low + genome.span
+        ).astype(np.uint8)
+        replaced = genome.random(len(genes), self.rng)
+        changed = np.where(genome.categorical, replaced, moved)
+        return genome.clamp(np.where(mutated, changed, genes))
+
+    def score(self, genes: np.ndarray) -> np.ndarray:
+        if self.fitness is None:
+            return self.rng.random(len(genes))
+        return np.asarray(self.fitness(genes), dtype=np.float64)
+
+    def step(
+        self,
+        children: int = 1024,
+        survivors: int = None,
+        rate: float = 0.05,
+        amount: float = 0.1,
+    ) -> np.ndarray:
+        """breed one generation, the best 'survivors' of parents and
+        children form the next. returns their scores, best first."""
+        survivors = survivors or len(self.genes)
+        offspring = self.mutate(self.crossover(children), rate, amount)
+        if self.scores is None:
+            self.scores = self.score(self.genes)
+        genes = np.concatenate((self.genes, offspring))
+        scores = np.concatenate((self.scores, self.score(offspring)))
+        best = np.argsort(-scores, kind="stable")[:survivors]
+        self.genes, self.scores = genes[best], scores[best]
+        self.generation += 1
+        return self.scores
+
+    def evolve(self, generations: int, **options) -> np.ndarray:
+        for _ in range(generations):
+            scores = self.step(**options)
+        return scores
+
+    def write(
+        self,
+        store: memory.PatchStore,
+        bank: int,
+        first: int = 0,
+        name: str = "evolute {n:03}",
+    ) -> int:
+        """write the best programs to consecutive slots of a bank for
+        audition, returns how many were written"""
+        count = min(len(self.genes), 128 - first)
+        for n in range(count):
+            record = store.record(bank, first + n)
+            record[:GENES] = self.genes[n].tobytes()
+            store.set_name(bank, first + n, name.format(n=n)[: store.NAME])
+        return count
+
+
+def likeness(programs, weights: dict = None):
+    """fitness that favours programs close to any of 'programs'
+
+    the distance is that of similarity.Features over the 128 parameters
+    """
+    index = similarity.SimilarityIndex(
+        np.asarray(programs, dtype=np.uint8).reshape(-1, GENES)[:, :PARAMETERS],
+        weights=weights,
+    )
+
+    def fitness(genes: np.ndarray) -> np.ndarray:
+        _, distances = index.like(genes[:, :PARAMETERS], k=1)
+        return -distances[:, 0]
+
+    return fitness
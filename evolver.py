@@ -3,15 +3,15 @@
 #
 
 import json
+import sys
 import wave
+from array import array
 from enum import IntEnum
 
-from mido import Message
-
+import memory
 import utils
 import parameters
 
-
 log = utils.get_logger("evolver")
 log.setLevel(20)
 
@@ -81,81 +81,71 @@ def serialize_program(program: dict) -> list:
 
 
 def serialize_main(main: dict) -> list:
-    data = []
-    for parameter in parameters.main:
-        data.extend(utils.encode_nibble(main.get(parameter)))
-    return data
+    return list(
+        utils.encode_nibbles(
+            bytes(main.get(parameter) for parameter in parameters.main)
+        )
+    )
 
 
 def serialize_waveshape(waveshape: list) -> list:
-    data = []
-    for point in waveshape:
-        data.append(point & 0xFF)
-        data.append(point >> 8)
-    return utils.pack_msbit(data)
-
-
-def serialize(data: list) -> tuple:
-    match data:
-        case [Partition.PROGRAM, bank, program]:
-            return bytes(
-                [
-                    Partition.PROGRAM.value,
-                    bank,
-                    program,
-                    *serialize_program(memory.get("edit")),
-                ]
-            )
-        case [Partition.PROGRAM, bank, prog, *part] if len(
-            part
-        ) == Length.PROGRAM:
-            return Partition.PROGRAM.value, bank, prog, *part
-        case [Partition.EDIT, *part] if len(part) == Length.PROGRAM:
-            return Partition.EDIT.value, *part
-        case [Partition.WAVESHAPE, n, *part] if len(part) == Length.WAVESHAPE:
-            return Partition.WAVESHAPE.value, n, *part
-        case [Partition.MAIN, *part] if len(part) == Length.MAIN:
-            return Partition.MAIN.value, *part
-        case [Partition.NAME, bank, program, *part] if len(part) == Length.NAME:
-            return Partition.NAME.value, bank, program, *part
-        case [Partition.NAME, *part] if len(part) == Length.NAME:
-            return (
-                Partition.NAME.value,
-                memory["main"]["bank"],
-                memory["main"]["program"],
-                *part,
-            )
-        case [Request.PROGRAM, bank, program]:
-            return Request.PROGRAM.value, bank, program
-        case [Request.PROGRAM]:
-            return (
-                Request.PROGRAM.value,
-                memory["main"]["bank"],
-                memory["main"]["program"],
-            )
-        case [Request.EDIT]:
-            return (Request.EDIT.value,)
-        case [Request.WAVESHAPE, n]:
-            return Request.WAVESHAPE.value, n
-        case [Request.MAIN]:
-            return (Request.MAIN.value,)
-        case [Request.NAME, bank, program]:
-            return Request.NAME.value, bank, program
-        case [Request.NAME]:
-            return (
-                Request.NAME.value,
-                memory["main"]["bank"],
-                memory["main"]["program"],
-            )
-        case [Parameter.PROGRAM, par, val]:
-            return (
-                Parameter.PROGRAM.value,
-                parameters.program[par],
-                *utils.encode_nibble(val),
-            )
-        case _:
-            log.warning(f"unknown command: {data=}")
-            return None
+    """pack 16-bit points, or their 256 byte little endian form, for the wire"""
+    if isinstance(waveshape, (bytes, bytearray, memoryview)):
+        return utils.pack_msbit(waveshape)
+    try:
+        points = array("h", waveshape)
+    except OverflowError:
+        points = array("H", waveshape)
+    if sys.byteorder == "big":
+        points.byteswap()
+    return utils.pack_msbit(points.tobytes())
+
+
+def _insert_current_program(data) -> bytes:
+    """add the bank and program of the main memory after the command byte"""
+    return bytes(
+        (data[0], memory.main["bank"], memory.main["program"], *data[1:])
+    )
+
+
+def _append_edit_program(data) -> bytes:
+    return bytes((*data, *serialize_program(memory.edit)))
+
+
+def _encode_parameter(data) -> bytes:
+    kind, parameter, value = data
+    if isinstance(parameter, str):
+        parameter = memory.program_index[parameter]
+    return bytes((kind, parameter, *utils.encode_nibble(value)))
+
+
+# serializers keyed on (command byte, message length)
+_serializers = {
+    (Partition.PROGRAM, 3): _append_edit_program,
+    (Partition.PROGRAM, 3 + Length.PROGRAM): bytes,
+    (Partition.EDIT, 1 + Length.PROGRAM): bytes,
+    (Partition.WAVESHAPE, 2 + Length.WAVESHAPE): bytes,
+    (Partition.MAIN, 1 + Length.MAIN): bytes,
+    (Partition.NAME, 3 + Length.NAME): bytes,
+    (Partition.NAME, 1 + Length.NAME): _insert_current_program,
+    (Request.PROGRAM, 3): bytes,
+    (Request.PROGRAM, 1): _insert_current_program,
+    (Request.EDIT, 1): bytes,
+    (Request.WAVESHAPE, 2): bytes,
+    (Request.MAIN, 1): bytes,
+    (Request.NAME, 3): bytes,
+    (Request.NAME, 1): _insert_current_program,
+    (Parameter.PROGRAM, 3): _encode_parameter,
+    (Parameter.SEQUENCER, 3): _encode_parameter,
+}
+
+
+def serialize(data: list) -> bytes | None:
+    handler = _serializers.get((data[0], len(data))) if len(data) else None
+    if handler is None:
+        log.warning(f"unknown command: {data=}")
+        return None
+    return handler(data)
 
 
 # TODO WHAT
@@ -174,7 +164,7 @@ def assemble(data: bytes) -> dict | list:
         case Length.MAIN:
             d = {
                 parameters.main[n]: val
-                for n, val in enumerate(utils.unpack_nibbles(data))
+                for n, val in enumerate(utils.decode_nibbles(data))
             }
         case Length.WAVESHAPE:
             d = utils.unpack_msbit(data)
@@ -183,29 +173,105 @@ def assemble(data: bytes) -> dict | list:
     return d
 
 
+# a program partition as received: partition, bank, program, packed payload
+PROGRAM_RECORD = 3 + Length.PROGRAM
+# payloads padded to a whole number of 8 byte groups unpack to 196 bytes,
+# of which the first 128 are parameters and the next 64 sequencer steps
+_PADDED_PROGRAM = -(-Length.PROGRAM // 8) * 8
+_PADDED_UNPACKED = utils.unpacked_length(_PADDED_PROGRAM)
+
+
+def assemble_many(stream: bytes, columnar: bool = False) -> list | tuple:
+    """decode a concatenated stream of program partitions in one pass
+
+    returns a list of {"bank", "prog", "patch"} dicts like receive_sysex, or
+    with 'columnar' a tuple of the (bank, program) index and two uint8 numpy
+    arrays shaped (count, 128) for the parameters and (count, 64) for the
+    sequences
+    """
+    stream = utils.as_bytes(stream)
+    count, rest = divmod(len(stream), PROGRAM_RECORD)
+    if rest or stream[::PROGRAM_RECORD].count(Partition.PROGRAM) != count:
+        raise ValueError(f"not a stream of program partitions: {len(stream)=}")
+
+    padded = bytearray(count * _PADDED_PROGRAM)
+    for n in range(count):
+        start = n * PROGRAM_RECORD + 3
+        padded[n * _PADDED_PROGRAM : n * _PADDED_PROGRAM + Length.PROGRAM] = (
+            stream[start : start + Length.PROGRAM]
+        )
+    unpacked = bytearray(count * _PADDED_UNPACKED)
+    utils.unpack_msbit_into(padded, unpacked)
+
+    index = list(zip(stream[1::PROGRAM_RECORD], stream[2::PROGRAM_RECORD]))
+    if columnar:
+        import numpy as np
+
+        rows = np.frombuffer(unpacked, dtype=np.uint8).reshape(
+            count, _PADDED_UNPACKED
+        )
+        return index, rows[:, :128].copy(), rows[:, 128:192].copy()
+
+    patches = []
+    for n, (bank, prog) in enumerate(index):
+        row = unpacked[n * _PADDED_UNPACKED : (n + 1) * _PADDED_UNPACKED]
+        patch = dict(zip(parameters.program, row[:128]))
+        patch["seq"] = list(row[128:192])
+        patches.append({"bank": bank, "prog": prog, "patch": patch})
+    return patches
+
+
+def _receive_program(data) -> dict:
+    return {"bank": data[1], "prog": data[2], "patch": assemble(data[3:])}
+
+
+def _receive_edit(data) -> dict:
+    return {"edit": assemble(data[1:])}
+
+
+def _receive_waveshape(data) -> dict:
+    return {"wave": data[1], "shape": assemble(data[2:])}
+
+
+def _receive_main(data) -> dict:
+    return {"main": assemble(data[1:])}
+
+
+def _receive_name(data) -> dict:
+    return {"bank": data[1], "prog": data[2], "name": assemble(data[3:])}
+
+
+def _receive_program_parameter(data):
+    memory.edit[parameters.program[data[1]]] = utils.decode_nibble(*data[2:])
+
+
+def _receive_sequencer_parameter(data):
+    memory.edit["seq"][data[1]] = utils.decode_nibble(*data[2:])
+
+
+def _receive_main_parameter(data):
+    memory.main[parameters.main[data[1]]] = utils.decode_nibble(*data[2:])
+
+
+# receivers keyed on (command byte, message length). handlers only slice
+# 'data' and the codec takes bytes as they are, so a bytes frame is decoded
+# without converting it; a tuple (mido's message.data) or memoryview payload
+# is copied to bytes once, by utils.as_bytes.
+_receivers = {
+    (Partition.PROGRAM, 3 + Length.PROGRAM): _receive_program,
+    (Partition.EDIT, 1 + Length.PROGRAM): _receive_edit,
+    (Partition.WAVESHAPE, 2 + Length.WAVESHAPE): _receive_waveshape,
+    (Partition.MAIN, 1 + Length.MAIN): _receive_main,
+    (Partition.NAME, 3 + Length.NAME): _receive_name,
+    (Parameter.PROGRAM, 4): _receive_program_parameter,
+    (Parameter.SEQUENCER, 4): _receive_sequencer_parameter,
+    (Parameter.MAIN, 4): _receive_main_parameter,
+}
+
+
 def receive_sysex(data: tuple):
-    match data:
-        case [Partition.PROGRAM, bank, prog, *part]:
-            return {"bank": bank, "prog": prog, "patch": assemble(part)}
-        case [Partition.EDIT, *part]:
-            return {"edit": assemble(part)}
-        case [Partition.WAVESHAPE, wave, *part]:
-            return {"wave": wave, "shape": assemble(part)}
-        case [Partition.MAIN, *part]:
-            return {"main": assemble(part)}
-        case [Partition.NAME, bank, prog, *part]:
-            return {"bank": bank, "prog": prog, "name": assemble(part)}
-
-        case [Parameter.PROGRAM, parameter, ls, ms]:
-            memory["edit"].update(
-                {parameters.program[parameter]: utils.decode_nibble(ls, ms)}
-            )
-        case [Parameter.SEQUENCER, step, ls, ms]:
-            memory.get("edit").get("seq")[step] = utils.decode_nibble(ls, ms)
-        case [Parameter.MAIN, parameter, ls, ms]:
-            memory["main"].update(
-                {parameters.main[parameter]: utils.decode_nibble(ls, ms)}
-            )
-
-        case _:
-            log.warning(f"received unknown: {data=}")
+    handler = _receivers.get((data[0], len(data))) if len(data) else None
+    if handler is None:
+        log.warning(f"received unknown: {data=}")
+        return None
+    return handler(data)
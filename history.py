@@ -0,0 +1,206 @@
+# history.py
+# undo and redo of the edit buffer
+#
+# the edit buffer is tracked as 192 slots: the 128 program parameters, then
+# the 64 sequencer steps. a step of history is bytes of (slot, old, new)
+# triples, so a knob move costs three bytes and a whole sweep of one knob
+# is merged into a single triple.
+
+from collections import deque
+from contextlib import contextmanager
+from time import monotonic
+
+import memory
+import parameters
+
+PARAMETERS = memory.PatchStore.PARAMETERS
+SLOTS = PARAMETERS + memory.PatchStore.STEPS
+# snapshots are tuples of immutable chunks of CHUNK slots, unchanged chunks
+# are shared between snapshots
+CHUNK = 16
+# bytes an empty step costs on top of its triples, in the deque and as object
+STEP_OVERHEAD = 48
+
+
+def slot(parameter: int | str) -> int:
+    """slot of a parameter name (or legacy name) or index"""
+    if isinstance(parameter, str):
+        return memory.program_index[parameter]
+    if parameter not in range(PARAMETERS):
+        raise IndexError(f"no such parameter: {parameter=}")
+    return parameter
+
+
+class History:
+    """undo and redo of changes to an edit buffer dict
+
+    changes made through set/set_step are recorded as they happen, changes
+    made elsewhere (evolver.receive_sysex) are picked up by commit. changes
+    to one slot less than 'sweep' seconds apart are one step. the oldest
+    steps are dropped when the history exceeds 'budget' bytes.
+    """
+
+    def __init__(
+        self,
+        edit: dict = None,
+        budget: int = 1 << 20,
+        sweep: float = 0.5,
+        clock=monotonic,
+    ):
+        self.edit = memory.edit if edit is None else edit
+        self.budget = budget
+        self.sweep = sweep
+        self.clock = clock
+        self.undo_steps = deque()
+        self.redo_steps = deque()
+        self.size = 0
+        self.evicted = 0
+        self.state = bytearray(self.read())
+        self._chunks = [None] * (SLOTS // CHUNK)
+        self._sweep = None
+        self._group = None
+
+    def read(self) -> bytes:
+        """the 192 slots of the edit buffer"""
+        return bytes(
+            (*map(self.edit.__getitem__, parameters.program), *self.edit["seq"])
+        )
+
+    def _write(self, n: int, value: int):
+        if n < PARAMETERS:
+            self.edit[parameters.program[n]] = value
+        else:
+            self.edit["seq"][n - PARAMETERS] = value
+        self.state[n] = value
+        self._chunks[n // CHUNK] = None
+
+    def _push(self, step: bytes):
+        self.undo_steps.append(step)
+        self.size += len(step) + STEP_OVERHEAD
+        self._evict()
+
+    def _evict(self):
+        while self.size > self.budget and self.undo_steps:
+            self.size -= len(self.undo_steps.popleft()) + STEP_OVERHEAD
+            self.evicted += 1
+            self._sweep = None
+
+    def _clear_redo(self):
+        while self.redo_steps:
+            self.size -= len(self.redo_steps.pop()) + STEP_OVERHEAD
+
+    def _record(self, n: int, value: int):
+        # checked before anything is written, edit and state stay in step
+        if value not in range(256):
+            raise ValueError(f"{value=} is not a byte")
+        old = self.state[n]
+        if old == value:
+            return
+        self._write(n, value)
+        self._clear_redo()
+        if self._group is not None:
+            self._group.setdefault(n, old)
+            return
+        now = self.clock()
+        if (
+            self._sweep is not None
+            and self._sweep[0] == n
+            and now - self._sweep[1] < self.sweep
+        ):
+            # extend the sweep: keep its first old value, take the new one
+            step = self.undo_steps.pop()
+            self.size -= len(step) + STEP_OVERHEAD
+            old = step[1]
+        self._sweep = n, now
+        if old != value:
+            self._push(bytes((n, old, value)))
+        else:
+            self._sweep = None
+
+    def set(self, parameter: int | str, value: int):
+        """change a program parameter of the edit buffer"""
+        self._record(slot(parameter), value)
+
+    def set_step(self, step: int, value: int):
+        """change a sequencer step of the edit buffer"""
+        if step not in range(memory.PatchStore.STEPS):
+            raise IndexError(f"no such step: {step=}")
+        self._record(PARAMETERS + step, value)
+
+    @contextmanager
+    def group(self):
+        """record all changes in the block as one step"""
+        if self._group is not None:
+            yield
+            return
+        self._group = {}
+        self._sweep = None
+        try:
+            yield
+        finally:
+            changes, self._group = self._group, None
+            step = bytes(
+                value
+                for n, old in changes.items()
+                if old != self.state[n]
+                for value in (n, old, self.state[n])
+            )
+            if step:
+                self._push(step)
+
+    def commit(self):
+        """record changes made to the edit buffer behind the history's back"""
+        current = self.read()
+        if current == self.state:
+            return
+        with self.group():
+            for n, (old, new) in enumerate(zip(self.state, current)):
+                if old != new:
+                    self._record(n, new)
+
+    def undo(self) -> bool:
+        """revert the last step, returns False if there is none"""
+        if not self.undo_steps:
+            return False
+        step = self.undo_steps.pop()
+        for n in range(len(step) - 3, -1, -3):
+            self._write(step[n], step[n + 1])
+        self.redo_steps.append(step)
+        self._sweep = None
+        return True
+
+    def redo(self) -> bool:
+        """apply the last undone step again, returns False if there is none"""
+        if not self.redo_steps:
+            return False
+        step = self.redo_steps.pop()
+        for n in range(0, len(step), 3):
+            self._write(step[n], step[n + 2])
+        self.undo_steps.append(step)
+        self._sweep = None
+        return True
+
+    def snapshot(self) -> tuple:
+        """the edit buffer as a tuple of chunks, shared while unchanged"""
+        for n, chunk in enumerate(self._chunks):
+            if chunk is None:
+                self._chunks[n] = bytes(self.state[n * CHUNK : (n + 1) * CHUNK])
+        return tuple(self._chunks)
+
+    def restore(self, snapshot: tuple):
+        """bring the edit buffer back to a snapshot, as one step"""
+        current = self.snapshot()
+        with self.group():
+            for n, (chunk, old) in enumerate(zip(snapshot, current)):
+                if chunk is old:
+                    continue
+                for m, value in enumerate(chunk, n * CHUNK):
+                    self._record(m, value)
+
+    def stats(self) -> dict:
+        return {
+            "undo": len(self.undo_steps),
+            "redo": len(self.redo_steps),
+            "bytes": self.size,
+            "evicted": self.evicted,
+        }
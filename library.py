@@ -0,0 +1,152 @@
+# library.py
+# binary program library, memory-mapped on load
+#
+# layout (little endian):
+#   header      32 bytes, see HEADER
+#   programs    banks x 128 records of PatchStore.RECORD bytes
+#   waveshapes  128 x 256 bytes, 128 16-bit points each
+
+import mmap
+import struct
+
+import memory
+import utils
+
+MAGIC = b"EVLB"
+VERSION = 1
+# magic, version, banks, record size, waveshapes, waveshape size,
+# program offset, waveshape offset
+HEADER = struct.Struct("<4sHHHHHxxII8x")
+WAVESHAPES = 128
+WAVESHAPE_SIZE = 256
+
+
+class Library:
+    """a library file opened via mmap, programs and waveshapes are views
+
+    the mapping can only be closed once no view of it is left: release the
+    views from waveshape() and patches.record/program/sequence, or let them
+    go out of scope, before close().
+    """
+
+    def __init__(self, filename: str, writable: bool = False):
+        with open(filename, "r+b" if writable else "rb") as file:
+            self.mmap = mmap.mmap(
+                file.fileno(),
+                0,
+                access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ,
+            )
+        self.view = self.patches = None
+        try:
+            (
+                magic,
+                version,
+                banks,
+                record,
+                waveshapes,
+                waveshape_size,
+                self.program_offset,
+                self.waveshape_offset,
+            ) = HEADER.unpack_from(self.mmap)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"not a library file: {magic=} {version=}")
+            if record != memory.PatchStore.RECORD or (
+                waveshapes,
+                waveshape_size,
+            ) != (WAVESHAPES, WAVESHAPE_SIZE):
+                raise ValueError(f"unsupported layout: {record=} {waveshapes=}")
+            end = max(
+                self.program_offset + banks * 128 * record,
+                self.waveshape_offset + WAVESHAPES * WAVESHAPE_SIZE,
+            )
+            if len(self.mmap) < end:
+                raise ValueError(f"truncated library: {len(self.mmap)=} {end=}")
+            self.view = memoryview(self.mmap)
+            self.patches = memory.PatchStore(
+                banks,
+                self.view[
+                    self.program_offset : self.program_offset
+                    + banks * 128 * record
+                ],
+            )
+        except Exception:
+            self._release()
+            raise
+
+    def waveshape(self, n: int) -> memoryview:
+        """zero-copy view of the 256 bytes of waveshape 'n'"""
+        if n not in range(WAVESHAPES):
+            raise IndexError(f"no such waveshape: {n=}")
+        start = self.waveshape_offset + n * WAVESHAPE_SIZE
+        return self.view[start : start + WAVESHAPE_SIZE]
+
+    def _release(self):
+        if self.patches is not None:
+            self.patches.buffer.release()
+        if self.view is not None:
+            self.view.release()
+        self.mmap.close()
+
+    def close(self):
+        """close the mapping, views handed out must be released first"""
+        try:
+            self._release()
+        except BufferError as error:
+            raise BufferError(
+                "library views are still in use, release them before close()"
+            ) from error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_library(filename: str, writable: bool = False) -> Library:
+    return Library(filename, writable)
+
+
+def save_library(
+    filename: str,
+    patches: memory.PatchStore = None,
+    waveshapes: dict = None,
+):
+    if patches is None:
+        patches = memory.patch
+    if waveshapes is None:
+        waveshapes = memory.waveshape
+    program_offset = HEADER.size
+    waveshape_offset = program_offset + len(patches.buffer)
+    with open(filename, "wb") as file:
+        file.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                patches.banks,
+                patches.RECORD,
+                WAVESHAPES,
+                WAVESHAPE_SIZE,
+                program_offset,
+                waveshape_offset,
+            )
+        )
+        file.write(patches.buffer)
+        for n in range(WAVESHAPES):
+            shape = bytes(waveshapes.get(n, b""))
+            if len(shape) > WAVESHAPE_SIZE:
+                raise ValueError(f"waveshape {n} too long: {len(shape)=}")
+            file.write(shape.ljust(WAVESHAPE_SIZE, b"\0"))
+
+
+def json_to_library(json_file: str, library_file: str):
+    """convert a program_memory.json style file to a library file"""
+    save_library(
+        library_file, memory.PatchStore.from_dict(utils.load_json(json_file))
+    )
+
+
+def library_to_json(library_file: str, json_file: str):
+    """convert a library file to the program_memory.json layout"""
+    with open_library(library_file) as library:
+        utils.save_json(json_file, library.patches.to_dict())
@@ -10,6 +10,8 @@ import mido
 
 from mido import Message
 
+from scheduler import OutputScheduler
+
 
 def midi_in_callback(message: Message):
     match message:
@@ -27,41 +29,26 @@ def midi_in_callback(message: Message):
             log.warning(f"received unknown: {message}")
 
 
-def queue_out_thread():
-    # global memory
-    bank = None
-    program = None
-    # queue_message(Request.MAIN)
-    while not midi_out.closed:
-        if bank != memory.get("main").get("bank") or program != memory.get(
-            "main"
-        ).get("program"):
-            # bank = memory.get("main").get("bank")
-            # program = memory.get("main").get("program")
-            log.info(f"program change -> {bank=} {program=}")
-            # queue_message(Request.EDIT)
-            # memory["patch"][bank][program].update(memory.get("edit"))
-        if not queue_out.empty():
-            message = queue_out.get()
-            midi_out.send(message)
-            queue_out.task_done()
-            log.info(f"sent {message}")
-        sleep(OUT_SPEED)
+def queue_message(*data):
+    scheduler.put(
+        Message(
+            type="sysex", data=(*evolver.sysex_id, *evolver.serialize(data))
+        )
+    )
 
 
 if __name__ == "__main__":
 
-    midi_in = utils.open_mido_input(config.midi_in, callback=midi_in_callback)
-    midi_out = utils.open_midi_output(config.midi_out)
+    midi_in = utils.open_input(config.midi_in, callback=midi_in_callback)
+    midi_out = utils.open_output(config.midi_out)
 
-    qot = Thread(target=queue_out_thread)
-    qot.start()
+    scheduler = OutputScheduler(midi_out, config.midi_bytes_per_second)
+    scheduler.start()
 
 
 """ TODO
 
 
-use: asyncio or trio
 what ui engine?
 ui and midi
 
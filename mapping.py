@@ -1,12 +1,31 @@
 # mapping strings to parameter values in a dictionary
 
+from collections import namedtuple
+from functools import cache
+
+import memory
+import parameters
+
+
+class Mapping(dict):
+    """value to string dict that remembers its offset and zero value"""
+
+    def __init__(self, *args, offset: int = 0, zero: int = 0):
+        super().__init__(*args)
+        self.offset = offset
+        self.zero = zero
+
 
 def make_mapping(strings: list, *, offset: int = 0, zero: int = 0) -> dict:
-    return {
-        n + offset: string
-        for n, string in enumerate(strings)
-        if string is not None
-    }
+    return Mapping(
+        {
+            n + offset: string
+            for n, string in enumerate(strings)
+            if string is not None
+        },
+        offset=offset,
+        zero=zero,
+    )
 
 
 bank = make_mapping([f"{n + 1:3}" for n in range(4)])
@@ -216,3 +235,168 @@ seq_dest = make_mapping(
     ]
 )
 mod_dest = make_mapping(mod_dest)
+
+# sequencer steps, 101 resets the sequence and 102 (sequence 1 only) rests
+seq_step = make_mapping([f"{n:3}" for n in range(101)] + ["Rst", "Rest"])
+
+# the table of every program parameter, in the order of parameters.program
+program = (
+    *(freq, fine_tune, osc_shape, level) * 4,
+    filter_freq,
+    mod_amount,
+    env_time,
+    env_time,
+    level,
+    env_time,
+    level,
+    level,
+    level,
+    level,
+    env_time,
+    env_time,
+    level,
+    env_time,
+    output_pan,
+    level,
+    feedback_freq,
+    level,
+    off_on,
+    del_time,
+    level,
+    level,
+    level,
+    hack,
+    *(lfo_speed, lfo_shape, lfo_amount, mod_dest) * 2,
+    mod_amount,
+    mod_dest,
+    env_time,
+    env_time,
+    level,
+    env_time,
+    trigger_select,
+    key_off_transpose,
+    *(seq_dest,) * 4,
+    level,
+    level,
+    ext_in_mode,
+    hack,
+    glide,
+    off_on,
+    bpm,
+    clock_div,
+    glide,
+    slop,
+    bend_range,
+    key_mode,
+    *(glide, level, shape_mod, level) * 2,
+    filter_pole,
+    level,
+    level,
+    level,
+    high_pass,
+    mod_source,
+    mod_amount,
+    mod_dest,
+    off_on,
+    level,
+    *(mod_source, mod_amount, mod_dest) * 3,
+    del_time,
+    level,
+    del_time,
+    level,
+    level,
+    *(lfo_speed, lfo_shape, lfo_amount, mod_dest) * 2,
+    env_time,
+    level,
+    *(mod_amount, mod_dest) * 7,
+)
+
+# tables whose values are categories rather than amounts
+categorical = (
+    osc_shape,
+    lfo_shape,
+    mod_dest,
+    seq_dest,
+    mod_source,
+    trigger_select,
+    ext_in_mode,
+    key_mode,
+    shape_mod,
+    filter_pole,
+    off_on,
+)
+
+
+# a program parameter: its range, zero value and display strings. a plain
+# namedtuple, typing.NamedTuple would double the import time of this module
+Descriptor = namedtuple(
+    "Descriptor", "name minimum maximum zero categorical display"
+)
+
+
+def _descriptor(name: str, table: Mapping) -> Descriptor:
+    # values outside the table are shown as the raw number
+    display = tuple(table.get(value, f"{value:3}") for value in range(256))
+    return Descriptor(
+        name,
+        min(table),
+        max(table),
+        table.zero,
+        any(table is category for category in categorical),
+        display,
+    )
+
+
+@cache
+def _tables() -> tuple:
+    """schema, display and parse tables, compiled on first use"""
+    schema = tuple(map(_descriptor, parameters.program, program))
+    display = tuple(descriptor.display for descriptor in schema)
+    # stripped labels first, lowercase ones for case insensitive entry. where
+    # labels repeat (lfo_amount, lfo_speed) the lowest value is parsed.
+    parse = tuple(
+        {text.strip().lower(): v for v, text in reversed(table.items())}
+        | {text.strip(): v for v, text in reversed(table.items())}
+        for table in program
+    )
+    return schema, display, parse
+
+
+def __getattr__(name: str):
+    """the compiled schema, indexed by parameter number (and value)"""
+    match name:
+        case "schema":
+            return _tables()[0]
+        case "display":
+            return _tables()[1]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def display_page(values: bytes) -> list:
+    """display strings of all parameters of a program"""
+    return list(map(tuple.__getitem__, _tables()[1], values))
+
+
+def parse(parameter: int | str, text: str) -> int:
+    """value of a display string of 'parameter', for text entry
+
+    a number that is no label is taken as the raw value, as display shows
+    values outside the table
+    """
+    if isinstance(parameter, str):
+        parameter = memory.program_index[parameter]
+    table = _tables()[2][parameter]
+    text = text.strip()
+    try:
+        return table[text]
+    except KeyError:
+        pass
+    try:
+        return table[text.lower()]
+    except KeyError:
+        pass
+    if text.isdigit() and int(text) < 256:
+        return int(text)
+    raise ValueError(
+        f"{text=} is not a value of {parameters.program[parameter]}"
+    )
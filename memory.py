@@ -4,10 +4,155 @@
 import parameters
 
 main = {parameters.main[n]: 0 for n in range(16)}
-edit = {parameters.program[n]: 0 for n in range(128)}
-protgram = {
-    b: {p: {parameters.program[n]: 0 for n in range(128)} for p in range(128)}
-    for b in range(4)
+edit = {parameters.program[n]: 0 for n in range(128)} | {"seq": [0] * 64}
+
+# parameter name (or legacy name) to its index in a program record
+program_index = {name: n for n, name in enumerate(parameters.program)} | {
+    old: parameters.program.index(new) for old, new in parameters.legacy.items()
 }
-waveshape = {w: bytes(256) for w in range(128)}
-name = {b: {p: "unknown         " for p in range(128)} for b in range(4)}
+
+
+class PatchStore:
+    """programs of one or more banks in a single contiguous buffer
+
+    every program is a fixed size record: 128 parameter bytes, 64 sequencer
+    steps and a 16 character name. the dict layout of program_memory.json is
+    only built on request by as_dict/to_dict.
+
+    record, program and sequence return views into the buffer. on a store
+    of a library.Library they must be released (or dropped) before the
+    library is closed.
+    """
+
+    PARAMETERS = 128
+    STEPS = 64
+    NAME = 16
+    RECORD = PARAMETERS + STEPS + NAME
+    SEQ_OFFSET = PARAMETERS
+    NAME_OFFSET = PARAMETERS + STEPS
+    DEFAULT_NAME = b"unknown         "
+
+    def __init__(self, banks: int = 4, buffer=None):
+        self.banks = banks
+        size = banks * 128 * self.RECORD
+        if buffer is None:
+            buffer = bytearray(
+                (bytes(self.NAME_OFFSET) + self.DEFAULT_NAME) * banks * 128
+            )
+        self.buffer = memoryview(buffer).cast("B")
+        if len(self.buffer) != size:
+            raise ValueError(f"{len(self.buffer)=}. should be {size}.")
+
+    def __len__(self) -> int:
+        return self.banks * 128
+
+    def __iter__(self):
+        """iterate over all (bank, program) slots"""
+        return ((b, p) for b in range(self.banks) for p in range(128))
+
+    def offset(self, bank: int, prog: int) -> int:
+        if bank not in range(self.banks) or prog not in range(128):
+            raise IndexError(f"no such program: {bank=} {prog=}")
+        return (bank * 128 + prog) * self.RECORD
+
+    def record(self, bank: int, prog: int) -> memoryview:
+        """zero-copy view of the whole record of a program"""
+        start = self.offset(bank, prog)
+        return self.buffer[start : start + self.RECORD]
+
+    def program(self, bank: int, prog: int) -> memoryview:
+        """zero-copy view of the 128 parameters of a program"""
+        start = self.offset(bank, prog)
+        return self.buffer[start : start + self.PARAMETERS]
+
+    def sequence(self, bank: int, prog: int) -> memoryview:
+        """zero-copy view of the 64 sequencer steps of a program"""
+        start = self.offset(bank, prog) + self.SEQ_OFFSET
+        return self.buffer[start : start + self.STEPS]
+
+    def get(self, bank: int, prog: int, parameter: str | int) -> int:
+        if isinstance(parameter, str):
+            parameter = program_index[parameter]
+        return self.program(bank, prog)[parameter]
+
+    def set(self, bank: int, prog: int, parameter: str | int, value: int):
+        if isinstance(parameter, str):
+            parameter = program_index[parameter]
+        self.program(bank, prog)[parameter] = value
+
+    def name(self, bank: int, prog: int) -> str:
+        start = self.offset(bank, prog) + self.NAME_OFFSET
+        return bytes(self.buffer[start : start + self.NAME]).decode("ascii")
+
+    def set_name(self, bank: int, prog: int, name: str):
+        if len(name) > self.NAME:
+            raise ValueError(f"{name=} too long ({self.NAME} characters max)")
+        start = self.offset(bank, prog) + self.NAME_OFFSET
+        self.buffer[start : start + self.NAME] = name.ljust(self.NAME).encode(
+            "ascii"
+        )
+
+    def as_dict(self, bank: int, prog: int) -> dict:
+        """program in the dict layout of program_memory.json"""
+        record = self.record(bank, prog)
+        return dict(zip(parameters.program, record[: self.PARAMETERS])) | {
+            "seq": list(record[self.SEQ_OFFSET : self.NAME_OFFSET]),
+            "name": self.name(bank, prog),
+        }
+
+    def update(self, bank: int, prog: int, patch: dict):
+        """update a program from a (partial) dict of parameters"""
+        program = self.program(bank, prog)
+        for key, value in patch.items():
+            match key:
+                case "seq":
+                    self.sequence(bank, prog)[: len(value)] = bytes(value)
+                case "name":
+                    self.set_name(bank, prog, value)
+                case _:
+                    program[program_index[key]] = value
+
+    def to_dict(self) -> dict:
+        """all programs as nested {bank: {program: dict}}"""
+        return {
+            b: {p: self.as_dict(b, p) for p in range(128)}
+            for b in range(self.banks)
+        }
+
+    @classmethod
+    def from_dict(cls, banks: dict) -> "PatchStore":
+        """store from the nested layout of program_memory.json
+
+        as many banks as the highest bank key, missing ones stay empty
+        """
+        store = cls(max(map(int, banks), default=-1) + 1)
+        for b, programs in banks.items():
+            for p, patch in programs.items():
+                store.update(int(b), int(p), patch)
+        return store
+
+    def load_columnar(self, index: list, programs, sequences):
+        """fill programs from the columnar result of evolver.assemble_many"""
+        programs = memoryview(programs).cast("B")
+        sequences = memoryview(sequences).cast("B")
+        for n, (bank, prog) in enumerate(index):
+            record = self.record(bank, prog)
+            record[: self.PARAMETERS] = programs[n * 128 : (n + 1) * 128]
+            record[self.SEQ_OFFSET : self.NAME_OFFSET] = sequences[
+                n * 64 : (n + 1) * 64
+            ]
+
+
+def __getattr__(name: str):
+    """create the program and waveshape banks on first use"""
+    match name:
+        case "patch":
+            value = PatchStore()
+        case "waveshape":
+            value = {w: bytes(256) for w in range(128)}
+        case _:
+            raise AttributeError(
+                f"module {__name__!r} has no attribute {name!r}"
+            )
+    globals()[name] = value
+    return value
@@ -0,0 +1,146 @@
+# morph.py
+# live morphs between two programs, streamed as parameter changes
+
+import asyncio
+import time
+from functools import cache
+
+import numpy as np
+
+import config
+import evolver
+import mapping
+import parameters
+from evolver import Parameter
+
+# wire size of one parameter change: F0, sysex id, the serialized change, F7
+MESSAGE_BYTES = (
+    len(evolver.sysex_id)
+    + len(evolver.serialize([Parameter.PROGRAM, 0, 0]))
+    + 2
+)
+
+
+def nearest_table(tables) -> np.ndarray:
+    """(len(tables), 256) nearest key of each value table for any byte"""
+    table = np.empty((len(tables), 256), dtype=np.uint8)
+    values = np.arange(256)
+    for n, values_table in enumerate(tables):
+        keys = np.array(sorted(values_table))
+        position = np.clip(np.searchsorted(keys, values), 1, len(keys) - 1)
+        lower, upper = keys[position - 1], keys[position]
+        table[n] = np.where(values - lower <= upper - values, lower, upper)
+    return table
+
+
+@cache
+def snap_table() -> np.ndarray:
+    """(128, 256) nearest value of each parameter's mapping for any byte"""
+    return nearest_table(mapping.program)
+
+
+@cache
+def categorical_mask() -> np.ndarray:
+    return np.array([descriptor.categorical for descriptor in mapping.schema])
+
+
+def as_program(program) -> np.ndarray:
+    """128 parameters of a dict (memory.edit layout) or bytes-like program"""
+    if isinstance(program, dict):
+        return np.fromiter(
+            map(program.__getitem__, parameters.program), np.uint8, 128
+        )
+    return np.frombuffer(bytes(program[:128]), dtype=np.uint8)
+
+
+class Morph:
+    """interpolate from program 'start' to program 'end'
+
+    continuous parameters move linearly and are snapped to a value of their
+    mapping table, categorical ones switch halfway. frames are sent at
+    'frame_rate' and never use more than 'bytes_per_second' of the wire;
+    when a frame changes more parameters than fit, the ones furthest from
+    their target go first and the rest follow in the next frames.
+    """
+
+    def __init__(
+        self,
+        start,
+        end,
+        frame_rate: float = 25.0,
+        bytes_per_second: int = config.midi_bytes_per_second,
+    ):
+        self.start = as_program(start)
+        self.end = as_program(end)
+        self.frame_rate = frame_rate
+        self.bytes_per_second = bytes_per_second
+        self._columns = np.arange(len(self.start))
+
+    def frames(self, positions) -> np.ndarray:
+        """(len(positions), 128) programs at positions from 0.0 to 1.0"""
+        positions = np.asarray(positions, dtype=np.float32)[:, None]
+        start = self.start.astype(np.float32)
+        values = start + positions * (self.end.astype(np.float32) - start)
+        values = np.rint(values).astype(np.uint8)
+        values = np.where(
+            categorical_mask(),
+            np.where(positions < 0.5, self.start, self.end),
+            values,
+        )
+        values = snap_table()[self._columns, values]
+        # the programs themselves may hold values outside their mapping
+        values[positions[:, 0] <= 0.0] = self.start
+        values[positions[:, 0] >= 1.0] = self.end
+        return values
+
+    def schedule(self, duration: float, current=None):
+        """yield (seconds, parameter changes) frame by frame
+
+        changes are (Parameter.PROGRAM, parameter, value) tuples, only for
+        parameters that differ from what was sent before. 'current' is the
+        program the evolver holds now, 'start' if not given.
+        """
+        count = max(1, round(duration * self.frame_rate))
+        frames = self.frames(np.arange(1, count + 1) / count)
+        sent = (self.start if current is None else as_program(current)).copy()
+        allowance = self.bytes_per_second / self.frame_rate
+        credit = 0.0
+        k = 0
+        while k < count or (sent != self.end).any():
+            target = frames[min(k, count - 1)]
+            # unused budget carries over for less than one message at most
+            credit = min(credit + allowance, max(allowance, MESSAGE_BYTES))
+            changed = np.flatnonzero(target != sent)
+            fits = int(credit // MESSAGE_BYTES)
+            if len(changed) > fits:
+                distance = np.abs(
+                    target[changed].astype(np.int16) - sent[changed]
+                )
+                changed = changed[np.argsort(-distance, kind="stable")[:fits]]
+                changed.sort()
+            sent[changed] = target[changed]
+            credit -= len(changed) * MESSAGE_BYTES
+            k += 1
+            yield k / self.frame_rate, [
+                (Parameter.PROGRAM, n, value)
+                for n, value in zip(changed.tolist(), target[changed].tolist())
+            ]
+
+    def run(self, send, duration: float, current=None):
+        """play the morph with 'send(*data)', blocking until it is done"""
+        start = time.monotonic()
+        for seconds, changes in self.schedule(duration, current):
+            delay = start + seconds - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            for data in changes:
+                send(*data)
+
+    async def play(self, send, duration: float, current=None):
+        """play the morph with 'send(*data)', e.g. AsyncEvolver.send"""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for seconds, changes in self.schedule(duration, current):
+            await asyncio.sleep(max(0.0, start + seconds - loop.time()))
+            for data in changes:
+                send(*data)
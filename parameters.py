@@ -147,3 +147,13 @@ program = (
     "foot_amount",
     "foot_dest",
 )
+
+# program parameter names used by older program_memory.json dumps
+legacy = {
+    "sync_2-1": "sync_21",
+    "fm_4-3": "fm_43",
+    "rm_4-3": "rm_43",
+    "fm_3-4": "fm_34",
+    "rm_3-4": "rm_34",
+    "exp-lin_env": "exp_lin_env",
+}
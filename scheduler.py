@@ -0,0 +1,153 @@
+# scheduler.py
+# midi output scheduler
+
+from collections import deque
+from threading import Condition, Thread
+from time import monotonic
+
+from mido import Message
+
+import config
+import evolver
+import utils
+
+log = utils.get_logger("scheduler")
+log.setLevel(20)
+
+
+_parameter_kinds = frozenset(evolver.Parameter)
+
+
+def parameter_key(message: Message) -> tuple | None:
+    """(parameter kind, index) of a parameter change sysex, None otherwise"""
+    data = message.data if message.type == "sysex" else ()
+    if len(data) == 7 and tuple(data[:3]) == evolver.sysex_id:
+        if data[3] in _parameter_kinds:
+            return data[3], data[4]
+    return None
+
+
+class OutputScheduler:
+    """send queued messages to a midi port from a worker thread
+
+    short messages (cc, program change, nrpn) are sent as soon as they are
+    queued. sysex is paced by its size so the port never gets more than
+    'bytes_per_second' of wire time. the worker blocks while there is
+    nothing to send.
+
+    a parameter change replaces a still queued change of the same parameter,
+    so only the latest value is sent. any other sysex (dumps, requests) is a
+    barrier: changes queued after it are never merged with ones before it.
+
+    a message the port fails to send is logged and counted in 'failed', the
+    worker carries on with the next one.
+    """
+
+    def __init__(
+        self, port, bytes_per_second: int = config.midi_bytes_per_second
+    ):
+        self.port = port
+        self.bytes_per_second = bytes_per_second
+        self.condition = Condition()
+        self.immediate = deque()
+        # entries are [key, message], key is None for messages that are
+        # never coalesced. 'pending' holds the entries that may still merge.
+        self.paced = deque()
+        self.pending = {}
+        self.closed = False
+        # monotonic time at which everything sent so far is on the wire
+        self.busy_until = 0.0
+        self.started = None
+        self.sent_messages = 0
+        self.sent_bytes = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.thread = Thread(target=self.run, name="midi out", daemon=True)
+
+    def start(self):
+        self.started = monotonic()
+        self.thread.start()
+
+    def close(self):
+        """send what is still queued, then stop the worker"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def put(self, message: Message):
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("scheduler is closed")
+            if message.type == "sysex":
+                key = parameter_key(message)
+                if key is None:
+                    self.pending.clear()
+                elif key in self.pending:
+                    self.pending[key][1] = message
+                    self.coalesced += 1
+                    return
+                entry = [key, message]
+                self.paced.append(entry)
+                if key is not None:
+                    self.pending[key] = entry
+            else:
+                self.immediate.append(message)
+            self.condition.notify()
+
+    @property
+    def depth(self) -> int:
+        """number of messages waiting to be sent"""
+        return len(self.immediate) + len(self.paced)
+
+    def stats(self) -> dict:
+        elapsed = monotonic() - self.started if self.started else 0.0
+        return {
+            "sent_messages": self.sent_messages,
+            "sent_bytes": self.sent_bytes,
+            "queue_depth": self.depth,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+            "messages_per_second": (
+                self.sent_messages / elapsed if elapsed else 0.0
+            ),
+            "bytes_per_second": self.sent_bytes / elapsed if elapsed else 0.0,
+        }
+
+    def next_message(self) -> Message | None:
+        """block until a message may be sent, None when closed and empty"""
+        with self.condition:
+            while True:
+                if self.immediate:
+                    return self.immediate.popleft()
+                if self.paced:
+                    wait = self.busy_until - monotonic()
+                    if wait <= 0:
+                        key, message = entry = self.paced.popleft()
+                        if self.pending.get(key) is entry:
+                            del self.pending[key]
+                        return message
+                    self.condition.wait(wait)
+                elif self.closed:
+                    return None
+                else:
+                    self.condition.wait()
+
+    def send(self, message: Message):
+        size = len(message.bytes())
+        self.port.send(message)
+        self.busy_until = (
+            max(self.busy_until, monotonic()) + size / self.bytes_per_second
+        )
+        self.sent_messages += 1
+        self.sent_bytes += size
+        log.debug(f"sent {message}")
+
+    def run(self):
+        while (message := self.next_message()) is not None:
+            try:
+                self.send(message)
+            except Exception:
+                self.failed += 1
+                log.exception(f"failed to send {message}")
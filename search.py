@@ -0,0 +1,219 @@
+# search.py
+# indexed search over patch libraries
+
+from bisect import bisect_left
+from collections import defaultdict
+
+import mapping
+import memory
+import parameters
+
+# translate tables that turn a column of values into '1' where the value
+# matches and '0' elsewhere, read back as a bitmap with int(..., 2)
+_MATCH = tuple(
+    bytes(0x31 if b == value else 0x30 for b in range(256))
+    for value in range(256)
+)
+# bit positions set in every byte value
+_BITS = tuple(tuple(n for n in range(8) if b >> n & 1) for b in range(256))
+
+# modulation routings: source label, amount parameter, destination parameter
+# and destination table. the source of mod1-4 is a parameter itself.
+_ROUTES = (
+    *(
+        (f"LFO{n}", f"lfo{n}_amount", f"lfo{n}_dest", mapping.mod_dest)
+        for n in range(1, 5)
+    ),
+    ("Env3", "env3_amount", "env3_dest", mapping.mod_dest),
+    *((f"Seq{n}", None, f"seq{n}_dest", mapping.seq_dest) for n in range(1, 5)),
+    ("Ext Peak", "in_peak_amount", "in_peak_dest", mapping.mod_dest),
+    ("Ext Env", "in_env_amount", "in_env_dest", mapping.mod_dest),
+    ("Note Vel", "vel_amount", "vel_dest", mapping.mod_dest),
+    ("MW", "modwheel_amount", "modwheel_dest", mapping.mod_dest),
+    ("Pressure", "pressure_amount", "pressure_dest", mapping.mod_dest),
+    ("BC", "breath_amount", "breath_dest", mapping.mod_dest),
+    ("FT", "foot_amount", "foot_dest", mapping.mod_dest),
+)
+_MOD_SLOTS = tuple(
+    (f"mod{n}_source", f"mod{n}_amount", f"mod{n}_dest") for n in range(1, 5)
+)
+# amount values that mean "no modulation": lfo amounts count 0-99 twice
+# (free running and key synced), the others are centered on 99
+_LFO_ZERO = (0, 100)
+_MOD_ZERO = (99,)
+
+
+def trigrams(name: str) -> set:
+    name = name.strip().lower()
+    return {name[n : n + 3] for n in range(len(name) - 2)}
+
+
+def _labels(table: dict, label: str) -> list:
+    return [value for value, text in table.items() if text.strip() == label]
+
+
+class PatchIndex:
+    """search programs of any number of libraries by parameter, name or
+    modulation routing
+
+    parameters are stored column-wise, one byte per program. bitmaps (ints
+    with bit n for program n) of every value of a parameter are built the
+    first time the parameter is queried and combined with & and |.
+    """
+
+    def __init__(self):
+        self.locations = []
+        self.columns = [bytearray() for _ in parameters.program]
+        self.names = []
+        self.bitmaps = {}
+        self.trigrams = defaultdict(list)
+        self.trigram_bitmaps = {}
+        self.sorted_names = None
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def add(self, store: memory.PatchStore, library: str = ""):
+        """index every program of 'store' under the name 'library'"""
+        first = len(self.locations)
+        self.locations.extend((library, b, p) for b, p in store)
+        for n, column in enumerate(self.columns):
+            column += store.buffer[n :: store.RECORD].tobytes()
+        for n, (b, p) in enumerate(store, first):
+            name = store.name(b, p)
+            self.names.append(name)
+            for trigram in trigrams(name):
+                self.trigrams[trigram].append(n)
+        self.bitmaps.clear()
+        self.trigram_bitmaps.clear()
+        self.sorted_names = None
+
+    @property
+    def all(self) -> int:
+        return (1 << len(self)) - 1
+
+    def from_ids(self, ids) -> int:
+        bits = bytearray(b"0" * len(self))
+        for n in ids:
+            bits[n] = 0x31
+        return int(bits[::-1] or b"0", 2)
+
+    def ids(self, bitmap: int) -> list:
+        """program numbers set in 'bitmap'"""
+        data = bitmap.to_bytes(-(-len(self) // 8), "little")
+        return [
+            8 * n + bit
+            for n, byte in enumerate(data)
+            if byte
+            for bit in _BITS[byte]
+        ]
+
+    def value_bitmaps(self, parameter: str | int) -> dict:
+        """bitmap of every value that 'parameter' has in the index"""
+        if isinstance(parameter, str):
+            parameter = memory.program_index[parameter]
+        if parameter not in self.bitmaps:
+            column = bytes(self.columns[parameter])
+            self.bitmaps[parameter] = {
+                value: int(column.translate(_MATCH[value])[::-1], 2)
+                for value in set(column)
+            }
+        return self.bitmaps[parameter]
+
+    def parameter(self, parameter: str | int, low: int, high: int = None):
+        """bitmap of programs with 'parameter' in 'low'..'high' inclusive"""
+        high = low if high is None else high
+        bitmap = 0
+        for value, bits in self.value_bitmaps(parameter).items():
+            if low <= value <= high:
+                bitmap |= bits
+        return bitmap
+
+    def name(self, text: str) -> int:
+        """bitmap of programs whose name contains 'text' (case insensitive)"""
+        text = text.strip().lower()
+        if len(text) < 3:
+            return self.prefix(text) if text else self.all
+        bitmap = self.all
+        for trigram in trigrams(text):
+            if trigram not in self.trigram_bitmaps:
+                self.trigram_bitmaps[trigram] = self.from_ids(
+                    self.trigrams.get(trigram, ())
+                )
+            bitmap &= self.trigram_bitmaps[trigram]
+        # trigrams can match out of order, check the candidates
+        return self.from_ids(
+            n for n in self.ids(bitmap) if text in self.names[n].lower()
+        )
+
+    def prefix(self, text: str) -> int:
+        """bitmap of programs whose name starts with 'text'"""
+        if self.sorted_names is None:
+            self.sorted_names = sorted(
+                (name.lower(), n) for n, name in enumerate(self.names)
+            )
+        text = text.lower()
+        start = bisect_left(self.sorted_names, (text,))
+        end = bisect_left(self.sorted_names, (text + "\uffff",))
+        return self.from_ids(n for _, n in self.sorted_names[start:end])
+
+    def active(self, amount: str | None) -> int:
+        """bitmap of programs where 'amount' is not zero"""
+        if amount is None:
+            return self.all
+        zero = _LFO_ZERO if amount.startswith("lfo") else _MOD_ZERO
+        bitmap = self.all
+        for value in zero:
+            bitmap &= ~self.parameter(amount, value)
+        return bitmap
+
+    def route(self, source: str, destination: str) -> int:
+        """bitmap of programs modulating 'destination' from 'source'
+
+        labels are those of mapping.mod_source and mapping.mod_dest, e.g.
+        route("LFO3", "Frq")
+        """
+        bitmap = 0
+        for label, amount, dest, table in _ROUTES:
+            if label == source:
+                for value in _labels(table, destination):
+                    bitmap |= self.parameter(dest, value) & self.active(amount)
+        for source_parameter, amount, dest in _MOD_SLOTS:
+            for value in _labels(mapping.mod_source, source):
+                matches = self.parameter(source_parameter, value)
+                if matches:
+                    targets = 0
+                    for target in _labels(mapping.mod_dest, destination):
+                        targets |= self.parameter(dest, target)
+                    bitmap |= matches & targets & self.active(amount)
+        return bitmap
+
+    def select(
+        self,
+        where: dict = None,
+        name: str = None,
+        prefix: str = None,
+        routes: list = (),
+    ) -> int:
+        """bitmap of programs matching every condition
+
+        'where' maps parameters to a value or an inclusive (low, high) range
+        """
+        bitmap = self.all
+        for parameter, value in (where or {}).items():
+            low, high = value if isinstance(value, tuple) else (value, value)
+            bitmap &= self.parameter(parameter, low, high)
+        if name is not None:
+            bitmap &= self.name(name)
+        if prefix is not None:
+            bitmap &= self.prefix(prefix)
+        for source, destination in routes:
+            bitmap &= self.route(source, destination)
+        return bitmap
+
+    def query(self, **conditions) -> list:
+        """(library, bank, program) of every program matching, see select"""
+        return [self.locations[n] for n in self.ids(self.select(**conditions))]
+
+    def count(self, **conditions) -> int:
+        return self.select(**conditions).bit_count()
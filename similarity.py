@@ -0,0 +1,163 @@
+# similarity.py
+# nearest neighbour search over program parameters
+
+import numpy as np
+
+import mapping
+import memory
+import parameters
+
+
+def _is_categorical(table: dict) -> bool:
+    return any(table is category for category in mapping.categorical)
+
+
+def store_arrays(store: memory.PatchStore) -> tuple:
+    """(programs, sequences) of a store as (n, 128) and (n, 64) uint8 views"""
+    records = np.frombuffer(store.buffer, dtype=np.uint8).reshape(
+        -1, store.RECORD
+    )
+    return (
+        records[:, : store.PARAMETERS],
+        records[:, store.SEQ_OFFSET : store.NAME_OFFSET],
+    )
+
+
+class Features:
+    """turns programs into weighted features
+
+    continuous parameters are scaled to 0..1 over the range of their mapping
+    table and multiplied by their weight. categorical ones (parameters whose
+    table is in mapping.categorical) are kept as codes: two programs with
+    different values are 'weight' apart, the distance of a one-hot encoding
+    without its memory cost. 'weights' maps parameter names to a factor,
+    'sequence' (a weight) adds the 64 sequencer steps as continuous values.
+    """
+
+    def __init__(self, weights: dict = None, sequence: float = 0.0):
+        weights = weights or {}
+        self.sequence = sequence
+        self.continuous = []
+        self.categorical = []
+        low, span, scale, category_weights = [], [], [], []
+        for n, (name, table) in enumerate(
+            zip(parameters.program, mapping.program)
+        ):
+            weight = weights.get(name, 1.0)
+            if not weight:
+                continue
+            if _is_categorical(table):
+                self.categorical.append(n)
+                category_weights.append(weight**2)
+            else:
+                self.continuous.append(n)
+                low.append(min(table))
+                span.append(max(table) - min(table) or 1)
+                scale.append(weight)
+        self.low = np.array(low, dtype=np.float32)
+        self.span = np.array(span, dtype=np.float32)
+        self.scale = np.array(scale, dtype=np.float32)
+        self.category_weights = np.array(category_weights, dtype=np.float32)
+
+    def __call__(self, programs, sequences=None) -> tuple:
+        """(continuous float32 vectors, categorical uint8 codes)"""
+        programs = np.asarray(programs, dtype=np.uint8).reshape(-1, 128)
+        values = programs[:, self.continuous].astype(np.float32)
+        np.clip((values - self.low) / self.span, 0.0, 1.0, out=values)
+        values *= self.scale
+        if self.sequence:
+            if sequences is None:
+                raise ValueError("sequence weight set but no sequences given")
+            steps = np.asarray(sequences, dtype=np.float32).reshape(-1, 64)
+            steps = np.clip(steps / 102.0, 0.0, 1.0) * (self.sequence / 8.0)
+            values = np.hstack((values, steps))
+        return values, np.ascontiguousarray(programs[:, self.categorical])
+
+
+def nearest(
+    features: Features,
+    vectors: np.ndarray,
+    codes: np.ndarray,
+    query_vectors: np.ndarray,
+    query_codes: np.ndarray,
+    k: int = 10,
+    batch: int = 256,
+    exclude: np.ndarray = None,
+) -> tuple:
+    """indices and distances of the 'k' nearest programs of each query
+
+    the continuous part of the squared distance of a batch of queries is
+    |q|^2 + |v|^2 - 2 q.v with one matrix product, the categorical part adds
+    the weight of every code that differs. 'exclude' holds a row of
+    'vectors' per query that is never returned for it.
+    """
+    k = min(k, len(vectors) - (exclude is not None))
+    norms = np.einsum("ij,ij->i", vectors, vectors)
+    indices = np.empty((len(query_vectors), k), dtype=np.int64)
+    distances = np.empty((len(query_vectors), k), dtype=np.float32)
+    for start in range(0, len(query_vectors), batch):
+        chunk = query_vectors[start : start + batch]
+        chunk_codes = query_codes[start : start + batch]
+        d = norms[None, :] - 2.0 * chunk @ vectors.T
+        d += np.einsum("ij,ij->i", chunk, chunk)[:, None]
+        np.maximum(d, 0.0, out=d)
+        for n, weight in enumerate(features.category_weights):
+            d += (codes[None, :, n] != chunk_codes[:, n, None]) * weight
+        if exclude is not None:
+            d[np.arange(len(d)), exclude[start : start + batch]] = np.inf
+        top = np.argpartition(d, k - 1, axis=1)[:, :k]
+        top_d = np.take_along_axis(d, top, axis=1)
+        order = np.argsort(top_d, axis=1)
+        indices[start : start + batch] = np.take_along_axis(top, order, axis=1)
+        distances[start : start + batch] = np.sqrt(
+            np.take_along_axis(top_d, order, axis=1)
+        )
+    return indices, distances
+
+
+class SimilarityIndex:
+    """precomputed features of a set of programs for repeated queries"""
+
+    def __init__(
+        self, programs, sequences=None, weights: dict = None, sequence=0.0
+    ):
+        self.features = Features(weights, sequence)
+        self.vectors, self.codes = self.features(programs, sequences)
+
+    @classmethod
+    def from_stores(cls, stores: list, **options) -> "SimilarityIndex":
+        arrays = [store_arrays(store) for store in stores]
+        return cls(
+            np.concatenate([programs for programs, _ in arrays]),
+            np.concatenate([sequences for _, sequences in arrays]),
+            **options,
+        )
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def like(self, programs, sequences=None, k: int = 10) -> tuple:
+        """nearest neighbours of programs given as parameter rows"""
+        return nearest(
+            self.features,
+            self.vectors,
+            self.codes,
+            *self.features(programs, sequences),
+            k,
+        )
+
+    def like_index(self, rows, k: int = 10) -> tuple:
+        """nearest neighbours of programs already in the index, by row
+
+        a program is never its own neighbour, its exact copies are
+        """
+        rows = np.atleast_1d(rows)
+        return nearest(
+            self.features,
+            self.vectors,
+            self.codes,
+            self.vectors[rows],
+            self.codes[rows],
+            k,
+            exclude=rows,
+        )
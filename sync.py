@@ -0,0 +1,112 @@
+# sync.py
+# send only what differs between the local library and the evolver
+
+import hashlib
+
+import evolver
+import memory
+import parameters
+import utils
+from evolver import Parameter, Partition
+
+log = utils.get_logger("sync")
+log.setLevel(20)
+
+
+def digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def fingerprint(
+    store: memory.PatchStore = None,
+    waveshapes: dict = None,
+) -> dict:
+    """hashes of every program, name and waveshape"""
+    if store is None:
+        store = memory.patch
+    if waveshapes is None:
+        waveshapes = memory.waveshape
+    return {
+        "program": {
+            (b, p): digest(evolver.serialize_program(store.as_dict(b, p)))
+            for b, p in store
+        },
+        "name": {
+            (b, p): digest(store.name(b, p).encode("ascii")) for b, p in store
+        },
+        "waveshape": {n: digest(bytes(s)) for n, s in waveshapes.items()},
+    }
+
+
+def plan(
+    store: memory.PatchStore = None,
+    waveshapes: dict = None,
+    hardware: dict = None,
+) -> tuple:
+    """messages that bring the evolver from 'hardware' to the local state
+
+    'hardware' is the fingerprint of the last known hardware state, without
+    it everything is sent. returns the messages and the new fingerprint.
+    """
+    if store is None:
+        store = memory.patch
+    if waveshapes is None:
+        waveshapes = memory.waveshape
+    hardware = hardware or {"program": {}, "name": {}, "waveshape": {}}
+    local = fingerprint(store, waveshapes)
+    messages = []
+    for b, p in store:
+        if local["program"][b, p] != hardware["program"].get((b, p)):
+            data = evolver.serialize_program(store.as_dict(b, p))
+            messages.append((Partition.PROGRAM, b, p, *data))
+        if local["name"][b, p] != hardware["name"].get((b, p)):
+            name = store.name(b, p).encode("ascii")
+            messages.append((Partition.NAME, b, p, *name))
+    for n, shape in waveshapes.items():
+        if local["waveshape"][n] != hardware["waveshape"].get(n):
+            # stored shapes are the 256 byte form sent on the wire
+            data = utils.pack_msbit(bytes(shape))
+            messages.append((Partition.WAVESHAPE, n, *data))
+    return messages, local
+
+
+def plan_edit(edit: dict, hardware_edit: dict, max_parameters: int = 8) -> list:
+    """messages that bring the hardware edit buffer to 'edit'
+
+    sends single parameter changes when fewer than 'max_parameters' differ,
+    the whole edit buffer otherwise
+    """
+    changed = [
+        (n, edit[name])
+        for n, name in enumerate(parameters.program)
+        if edit.get(name) != hardware_edit.get(name)
+    ]
+    hardware_seq = hardware_edit.get("seq") or [None] * 64
+    steps = [
+        (n, value)
+        for n, value in enumerate(edit.get("seq", ()))
+        if value != hardware_seq[n]
+    ]
+    if len(changed) + len(steps) >= max_parameters:
+        return [(Partition.EDIT, *evolver.serialize_program(edit))]
+    return [(Parameter.PROGRAM, n, value) for n, value in changed] + [
+        (Parameter.SEQUENCER, n, value) for n, value in steps
+    ]
+
+
+def sync(
+    send,
+    store: memory.PatchStore = None,
+    waveshapes: dict = None,
+    hardware: dict = None,
+) -> dict:
+    """send what differs with 'send(*data)', return the new fingerprint"""
+    if store is None:
+        store = memory.patch
+    if waveshapes is None:
+        waveshapes = memory.waveshape
+    messages, local = plan(store, waveshapes, hardware)
+    for data in messages:
+        send(*data)
+    log.info(f"sync sent {len(messages)} messages")
+    return local
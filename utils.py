@@ -1,20 +1,27 @@
 import json
 import logging
+import mmap
+import os
 import struct
+import sys
 import wave
+from array import array
 
-import mido
+import memory
 
 
 def get_logger(name: str) -> logging.Logger:
     log_format = logging.Formatter(
         "[%(asctime)s %(levelname)s] %(message)s", datefmt="%Y.%m.%d %H:%M:%S"
     )
-    log_stdout = logging.StreamHandler(format=log_format)
-    return logging.getLogger(name, handler=log_stdout)
+    log_stdout = logging.StreamHandler()
+    log_stdout.setFormatter(log_format)
+    logger = logging.getLogger(name)
+    logger.addHandler(log_stdout)
+    return logger
 
 
-def save_json(filename: str, memory_dict: dict = memory.get("edit")):
+def save_json(filename: str, memory_dict: dict = memory.edit):
     with open(filename, "w") as file:
         json.dump(memory_dict, file, indent=2)
 
@@ -24,55 +31,202 @@ def load_json(filename: str) -> dict:
         return json.load(file)
 
 
-def save_sysex(filename: str, memory_dict: dict = memory.get("edit")):
-    # TODO serialize output and write valid sysex strings
-    # mido.write_syx_file(filename)
-    # file.write(Message(type='sysex', data=(*SYSEX_ID, *pdata)).bytes())
-    pass
-
-
-def load_sysex(filename: str) -> dict:
-    # sysex_stream = mido.read_syx_file(filename)
-    # TODO deserialize sysex, first chop it in parts
-    #      then put it through receive message
-    pass
-
-
-def save_waveshape(filename: str, n: int):
+SYSEX_START = 0xF0
+SYSEX_END = 0xF7
+
+
+def iter_sysex(filename: str, max_size: int = 4096):
+    """yield the data of every sysex frame in a file, without F0 and F7
+
+    the file is memory-mapped and scanned frame by frame, so only the frame
+    being yielded is held in memory. frames longer than 'max_size' are
+    skipped.
+    """
+    with open(filename, "rb") as file:
+        if not os.fstat(file.fileno()).st_size:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as stream:
+            start = stream.find(bytes([SYSEX_START]))
+            while start != -1:
+                end = stream.find(bytes([SYSEX_END]), start + 1)
+                if end == -1:
+                    raise ValueError(f"unterminated sysex at {start=}")
+                # a new F0 before F7 means the frame was cut off
+                restart = stream.find(bytes([SYSEX_START]), start + 1, end)
+                if restart != -1:
+                    start = restart
+                    continue
+                if end - start - 1 <= max_size:
+                    yield stream[start + 1 : end]
+                start = stream.find(bytes([SYSEX_START]), end + 1)
+
+
+def save_sysex(
+    filename: str,
+    store: memory.PatchStore = None,
+    waveshapes: dict = None,
+):
+    """write every program, name and waveshape of 'store' as one .syx file"""
+    import evolver
+
+    if store is None:
+        store = memory.patch
+    program_frame = 7 + evolver.Length.PROGRAM + 1
+    name_frame = 7 + evolver.Length.NAME + 1
+    waveshape_frame = 6 + evolver.Length.WAVESHAPE + 1
+    waveshapes = waveshapes or {}
+    out = bytearray(
+        len(store) * (program_frame + name_frame)
+        + len(waveshapes) * waveshape_frame
+    )
+    offset = 0
+    for bank, prog in store:
+        record = store.record(bank, prog)
+        for header, payload in (
+            ((evolver.Partition.PROGRAM, bank, prog), None),
+            ((evolver.Partition.NAME, bank, prog), record[store.NAME_OFFSET :]),
+        ):
+            out[offset] = SYSEX_START
+            out[offset + 1 : offset + 7] = bytes((*evolver.sysex_id, *header))
+            offset += 7
+            if payload is None:
+                offset += pack_msbit_into(
+                    record[: store.NAME_OFFSET], out, offset
+                )
+            else:
+                out[offset : offset + len(payload)] = payload
+                offset += len(payload)
+            out[offset] = SYSEX_END
+            offset += 1
+    for n, shape in waveshapes.items():
+        out[offset] = SYSEX_START
+        out[offset + 1 : offset + 6] = bytes(
+            (*evolver.sysex_id, evolver.Partition.WAVESHAPE, n)
+        )
+        offset += 6
+        offset += pack_msbit_into(shape, out, offset)
+        out[offset] = SYSEX_END
+        offset += 1
+    with open(filename, "wb") as file:
+        file.write(out)
+
+
+def load_sysex(filename: str):
+    """decode the evolver sysex in a file one message at a time"""
+    import evolver
+
+    for frame in iter_sysex(filename):
+        if tuple(frame[:3]) != evolver.sysex_id:
+            continue
+        yield evolver.receive_sysex(frame[3:])
+
+
+# unsigned 8-bit samples to signed, as two's complement bytes
+_SIGNED_8BIT = bytes((b - 128) & 0xFF for b in range(256))
+
+
+def save_waveshape(filename: str, shape: bytes):
+    """write a waveshape (16-bit little endian points) as a mono .wav"""
     with wave.open(filename, "wb") as wavefile:
         wavefile.setnchannels(1)
         wavefile.setframerate(44100)
         wavefile.setsampwidth(2)
-        wavefile.setnframes(128)
-        wavefile.writeframes(memory["waveshape"][n])
-
-
-def load_waveshape(filename: str) -> dict:
-    # TODO load from standard pcm .wav
+        wavefile.setnframes(len(shape) // 2)
+        wavefile.writeframes(shape)
+
+
+def read_samples(wavefile: wave.Wave_read) -> array:
+    """first channel of a pcm .wav as signed 16-bit samples"""
+    width = wavefile.getsampwidth()
+    frames = wavefile.readframes(wavefile.getnframes())
+    match width:
+        case 1:
+            # 8-bit wav is unsigned
+            samples = array("b", frames.translate(_SIGNED_8BIT))
+            samples = array("h", (s << 8 for s in samples))
+        case 2:
+            samples = array("h", frames)
+        case 3 | 4:
+            # keep the two most significant bytes of every sample
+            samples = array("h")
+            samples.frombytes(
+                b"".join(
+                    frames[n + width - 2 : n + width]
+                    for n in range(0, len(frames), width)
+                )
+            )
+        case _:
+            raise ValueError(f"unsupported sample width: {width=}")
+    if sys.byteorder == "big" and width > 1:
+        samples.byteswap()
+    return samples[:: wavefile.getnchannels()]
+
+
+def resample(samples, points: int = 128, normalize: bool = False) -> array:
+    """linear interpolation of one cycle of 'samples' to 'points' values"""
+    size = len(samples)
+    if not size:
+        raise ValueError("no samples to resample")
+    step = size / points
+    values = []
+    for n in range(points):
+        position = n * step
+        index = int(position)
+        fraction = position - index
+        following = samples[(index + 1) % size]
+        values.append(samples[index] + (following - samples[index]) * fraction)
+    if normalize:
+        peak = max(map(abs, values))
+        if peak:
+            values = [v * 32767 / peak for v in values]
+    return array("h", (max(-32768, min(32767, round(v))) for v in values))
+
+
+def load_waveshape(
+    filename: str, points: int = 128, normalize: bool = False
+) -> bytes:
+    """waveshape from a pcm .wav, resampled to 'points' if needed"""
     with wave.open(filename, "rb") as wavefile:
-        pass
+        samples = read_samples(wavefile)
+    if len(samples) != points or normalize:
+        samples = resample(samples, points, normalize)
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples.tobytes()
 
 
-def open_input(portname: str):
+def open_input(portname: str, callback=None):
     """Open the first input port that starts with 'portname'"""
+    import mido
+
     for p in mido.get_input_names():
         if p.startswith(portname):
-            return mido.open_input(p)
+            return mido.open_input(p, callback=callback)
     raise ValueError(f"No such port: {portname=}")
 
 
 def open_output(portname: str):
     """Open the first output port that starts with 'portname'"""
+    import mido
+
     for p in mido.get_output_names():
         if p.startswith(portname):
             return mido.open_output(p)
     raise ValueError(f"No such port: {portname=}")
 
 
+# nibble tables: each byte as its (ls, ms) pair, its low and high nibble,
+# and a nibble shifted into the high half
+_NIBBLE_PAIRS = tuple(bytes([b & 0xF, b >> 4]) for b in range(256))
+_LOW_NIBBLE = bytes(b & 0xF for b in range(256))
+_HIGH_NIBBLE = bytes(b >> 4 for b in range(256))
+_SHIFT_NIBBLE = bytes((b << 4) & 0xFF for b in range(256))
+
+
 def encode_nibble(b: int) -> bytes:
     """encode 8-bit integer to 4-bit bytestream"""
     if b in range(256):
-        return bytes([b & 0xF, b >> 4])
+        return _NIBBLE_PAIRS[b]
     else:
         raise ValueError(f"{b} is not byte sized ({range(256)=})")
 
@@ -85,6 +239,46 @@ def decode_nibble(ls: int, ms: int) -> int:
         raise ValueError(f"{ls=} or {ms=} is not nibble sized ({range(16)=})")
 
 
+def encode_nibbles(data: bytes, endian: str = "little") -> bytes:
+    """encode a buffer of 8-bit integers to a 4-bit bytestream in one call"""
+    data = as_bytes(data)
+    packed_data = bytearray(2 * len(data))
+    match endian:
+        case "little":
+            packed_data[0::2] = data.translate(_LOW_NIBBLE)
+            packed_data[1::2] = data.translate(_HIGH_NIBBLE)
+        case "big":
+            packed_data[0::2] = data.translate(_HIGH_NIBBLE)
+            packed_data[1::2] = data.translate(_LOW_NIBBLE)
+        case _:
+            raise ValueError(f"{endian=}. should be 'little' or 'big'.")
+    return bytes(packed_data)
+
+
+def decode_nibbles(
+    packed_data: bytes, endian: str = "little", validate: bool = True
+) -> bytes:
+    """combine a 4-bit bytestream to 8-bit integers in one call
+
+    with 'validate' a nibble out of range raises the same ValueError as
+    decode_nibble for the first offending pair
+    """
+    packed_data = as_bytes(packed_data)
+    if len(packed_data) % 2:
+        raise ValueError(f"{len(packed_data)=}. should be even.")
+    match endian:
+        case "little":
+            ls, ms = packed_data[0::2], packed_data[1::2]
+        case "big":
+            ms, ls = packed_data[0::2], packed_data[1::2]
+        case _:
+            raise ValueError(f"{endian=}. should be 'little' or 'big'.")
+    if validate and packed_data and max(packed_data) > 0xF:
+        for pair in zip(ls, ms):
+            decode_nibble(*pair)
+    return _or_bytes(ls.translate(_LOW_NIBBLE), ms.translate(_SHIFT_NIBBLE))
+
+
 def unpack_nibbles(packed_data: bytes, endian: str = "little") -> tuple:
     """unpack a stream of nibbles in bytes format"""
     if type(packed_data) is not bytes:
@@ -92,14 +286,9 @@ def unpack_nibbles(packed_data: bytes, endian: str = "little") -> tuple:
     if len(packed_data) % 2:
         raise ValueError(f"{len(packed_data)=}. should be even.")
 
-    idat = iter(packed_data)
-    zdat = zip(idat, idat)
-
     match endian:
-        case "little":
-            return tuple(decode_nibble(ls, ms) for (ls, ms) in zdat)
-        case "big":
-            return tuple(decode_nibble(ls, ms) for (ms, ls) in zdat)
+        case "little" | "big":
+            return tuple(decode_nibbles(packed_data, endian))
 
 
 def unpack_str(data: bytes) -> str:
@@ -117,35 +306,78 @@ def pack_str(string: str) -> bytes:
 #        raise OverflowError("[ERROR]: string too long (16 characters maximum)")
 
 
+# lookup tables for the ms-bit codec. the evolver sends 7 data bytes as a group
+# of 8: one byte holding the 7 most significant bits, then the 7 low parts.
+# every table handles a whole column (the n-th byte of each group) at once.
+_LOW7 = bytes(b & 0x7F for b in range(256))
+_MSBIT = tuple(bytes((b >> 7) << n for b in range(256)) for n in range(7))
+_SETBIT = tuple(
+    bytes(0x80 if b >> n & 1 else 0 for b in range(256)) for n in range(7)
+)
+
+
+def as_bytes(data) -> bytes:
+    """'data' as bytes, copying only when it is not bytes already"""
+    if isinstance(data, (bytes, bytearray)):
+        return data
+    return bytes(data)
+
+
+def _or_bytes(a: bytes, b: bytes) -> bytes:
+    """bitwise or of two bytestrings of equal length"""
+    return (int.from_bytes(a, "big") | int.from_bytes(b, "big")).to_bytes(
+        len(a), "big"
+    )
+
+
+def packed_length(size: int) -> int:
+    """length of 'size' bytes after ms-bit packing"""
+    return size + -(-size // 7)
+
+
+def unpacked_length(size: int) -> int:
+    """length of 'size' ms-bit packed bytes after unpacking"""
+    return size - -(-size // 8)
+
+
+def pack_msbit_into(data: bytes, out: bytearray, offset: int = 0) -> int:
+    """ms-bit pack 'data' into 'out' at 'offset', return the packed length"""
+    data = as_bytes(data)
+    end = offset + packed_length(len(data))
+    ms_bits = bytes(-(-len(data) // 7))
+    for n in range(7):
+        column = data[n::7]
+        out[offset + n + 1 : end : 8] = column.translate(_LOW7)
+        ms_bits = _or_bytes(
+            ms_bits, column.translate(_MSBIT[n]).ljust(len(ms_bits), b"\0")
+        )
+    out[offset:end:8] = ms_bits
+    return end - offset
+
+
+def unpack_msbit_into(
+    packed_data: bytes, out: bytearray, offset: int = 0
+) -> int:
+    """unpack ms-bit 'packed_data' into 'out' at 'offset', return the length"""
+    packed_data = as_bytes(packed_data)
+    end = offset + unpacked_length(len(packed_data))
+    ms_bits = packed_data[0::8]
+    for n in range(7):
+        column = packed_data[n + 1 :: 8]
+        high = ms_bits.translate(_SETBIT[n])[: len(column)]
+        out[offset + n : end : 7] = _or_bytes(column, high)
+    return end - offset
+
+
 def pack_msbit(data: tuple) -> bytes:
-    packed_data = []
-    count = 0
-    for n, byte in enumerate(data):
-        count, cycle = divmod(n, 7)
-        ms_bit = byte >> 7
-        # growing from 7 bytes to 8 bytes per cycle
-        ms_bits_index = n + count - cycle
-        if cycle == 0:
-            # cycle starts with ms_bit_byte is 8th byte
-            packed_data.append(ms_bit)
-            packed_data.append(byte & 0x7F)
-        else:
-            packed_data.append(byte & 0x7F)
-            packed_data[ms_bits_index] = packed_data[ms_bits_index] | (
-                ms_bit << cycle
-            )
+    data = as_bytes(data)
+    packed_data = bytearray(packed_length(len(data)))
+    pack_msbit_into(data, packed_data)
     return bytes(packed_data)
 
 
 def unpack_msbit(packed_data: bytes) -> tuple:
-    data = []
-    for n, byte in enumerate(packed_data):
-        cycle = n % 8
-        if cycle == 0:
-            ms_bits = byte
-        else:
-            if ms_bits & (1 << (cycle - 1)):
-                data.append(byte | 0x80)
-            else:
-                data.append(byte)
+    packed_data = as_bytes(packed_data)
+    data = bytearray(unpacked_length(len(packed_data)))
+    unpack_msbit_into(packed_data, data)
     return tuple(data)
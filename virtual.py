@@ -0,0 +1,295 @@
+# virtual.py
+# a software evolver for testing and benchmarking without hardware
+
+import heapq
+from itertools import count
+from threading import Condition, Thread
+from time import monotonic
+
+from mido import Message
+
+import config
+import evolver
+import library
+import memory
+import parameters
+import utils
+import waveshape
+from evolver import Length, Parameter, Partition, Request
+
+log = utils.get_logger("virtual")
+log.setLevel(20)
+
+
+def _unpack_program(payload: bytes) -> bytes:
+    return bytes(utils.unpack_msbit(payload)[: memory.PatchStore.NAME_OFFSET])
+
+
+class VirtualEvolver:
+    """answers requests from its own program and waveshape memory
+
+    use it where a mido output port is expected (AsyncEvolver, the
+    OutputScheduler): 'send' takes the messages for the evolver, replies go
+    to 'listener' like the callback of an input port. both directions take
+    the wire time of 'bytes_per_second' (31.25 kbaud), messages are applied
+    when their last byte has arrived. with 'bytes_per_second' None
+    everything happens at once, in the caller's thread.
+    """
+
+    def __init__(
+        self,
+        store: memory.PatchStore = None,
+        waveshapes: waveshape.WaveshapeBank = None,
+        listener=None,
+        bytes_per_second: int | None = config.midi_bytes_per_second,
+    ):
+        self.store = memory.PatchStore() if store is None else store
+        if waveshapes is None:
+            waveshapes = waveshape.WaveshapeBank()
+        self.waveshapes = waveshapes
+        self.listener = listener
+        self.bytes_per_second = bytes_per_second
+        self.edit = bytearray(memory.PatchStore.NAME_OFFSET)
+        self.main = dict.fromkeys(parameters.main, 0)
+        self.received_messages = self.received_bytes = 0
+        self.sent_messages = self.sent_bytes = 0
+        # wire timing: events are (due, order, handler, message)
+        self.condition = Condition()
+        self.events = []
+        self.order = count()
+        self.input_free = self.output_free = 0.0
+        self.closed = False
+        self.thread = None
+        if bytes_per_second:
+            self.thread = Thread(target=self.run, name="virtual", daemon=True)
+            self.thread.start()
+
+    @classmethod
+    def from_library(cls, filename: str, **options) -> "VirtualEvolver":
+        """evolver loaded with a copy of a library file"""
+        with library.open_library(filename) as source:
+            store = memory.PatchStore(
+                source.patches.banks, bytearray(source.patches.buffer)
+            )
+            shapes = waveshape.WaveshapeBank()
+            for n in range(library.WAVESHAPES):
+                shapes[n] = source.waveshape(n)
+        return cls(store, shapes, **options)
+
+    @classmethod
+    def open(cls, name: str = "Virtual Evolver", **options):
+        """evolver behind a virtual midi port, needs a backend that has them
+
+        returns the evolver and the port, close both when done
+        """
+        import mido
+
+        device = cls(**options)
+        port = mido.open_ioport(name, virtual=True, callback=device.send)
+        device.listener = port.send
+        return device, port
+
+    def close(self):
+        """deliver what is on the wire, then stop"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _wire_time(self, message: Message) -> float:
+        return len(message.bytes()) / self.bytes_per_second
+
+    def send(self, message: Message):
+        """a message for the evolver, as mido's port.send"""
+        self.received_messages += 1
+        self.received_bytes += len(message.bytes())
+        if not self.bytes_per_second:
+            self.receive(message)
+            return
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("virtual evolver is closed")
+            self.input_free = max(self.input_free, monotonic())
+            self.input_free += self._wire_time(message)
+            self._schedule(self.input_free, self.receive, message)
+
+    def _schedule(self, due: float, handler, message: Message):
+        heapq.heappush(self.events, (due, next(self.order), handler, message))
+        self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while True:
+                    if self.events:
+                        wait = self.events[0][0] - monotonic()
+                        if wait <= 0:
+                            _, _, handler, message = heapq.heappop(self.events)
+                            break
+                        self.condition.wait(wait)
+                    elif self.closed:
+                        return
+                    else:
+                        self.condition.wait()
+            try:
+                handler(message)
+            except Exception:
+                # like the hardware, carry on with the next message
+                log.exception(f"virtual evolver failed on {message}")
+
+    def reply(self, data: bytes):
+        """send a sysex with 'data' back, after its wire time"""
+        message = Message(type="sysex", data=(*evolver.sysex_id, *data))
+        self.sent_messages += 1
+        self.sent_bytes += len(message.bytes())
+        if not self.bytes_per_second:
+            self.deliver(message)
+            return
+        with self.condition:
+            self.output_free = max(self.output_free, monotonic())
+            self.output_free += self._wire_time(message)
+            self._schedule(self.output_free, self.deliver, message)
+
+    def deliver(self, message: Message):
+        if self.listener is not None:
+            self.listener(message)
+
+    def receive(self, message: Message):
+        """apply a message that has fully arrived"""
+        match message.type:
+            case "sysex":
+                data = message.data
+                if tuple(data[:3]) != evolver.sysex_id:
+                    return
+                data = bytes(data[3:])
+                handler = _handlers.get((data[0], len(data))) if data else None
+                if handler is None:
+                    log.warning(f"virtual evolver ignores: {data=}")
+                    return
+                try:
+                    handler(self, data)
+                except (IndexError, ValueError) as error:
+                    log.warning(f"virtual evolver ignores {data=}: {error}")
+            case "program_change":
+                self.main["program"] = message.program
+                self.load_edit()
+            case "control_change" if message.control == evolver.CC.BANK_CHANGE:
+                if message.value in range(self.store.banks):
+                    self.main["bank"] = message.value
+
+    def load_edit(self):
+        """the current program to the edit buffer, as a program change"""
+        record = self.store.record(self.main["bank"], self.main["program"])
+        self.edit[:] = record[: memory.PatchStore.NAME_OFFSET]
+
+    # partitions received
+
+    def _program(self, data: bytes):
+        record = self.store.record(data[1], data[2])
+        record[: memory.PatchStore.NAME_OFFSET] = _unpack_program(data[3:])
+
+    def _edit(self, data: bytes):
+        self.edit[:] = _unpack_program(data[1:])
+
+    def _waveshape(self, data: bytes):
+        self.waveshapes[data[1]] = bytes(utils.unpack_msbit(data[2:]))[
+            : waveshape.SIZE
+        ]
+
+    def _main(self, data: bytes):
+        self.main.update(zip(parameters.main, utils.decode_nibbles(data[1:])))
+
+    def _name(self, data: bytes):
+        self.store.set_name(data[1], data[2], data[3:].decode("ascii"))
+
+    def _program_parameter(self, data: bytes):
+        # the edit buffer goes on with the sequencer steps, never write those
+        if data[1] >= memory.PatchStore.PARAMETERS:
+            raise IndexError(f"no such program parameter: {data[1]}")
+        self.edit[data[1]] = utils.decode_nibble(*data[2:])
+
+    def _sequencer_parameter(self, data: bytes):
+        self.edit[memory.PatchStore.SEQ_OFFSET + data[1]] = utils.decode_nibble(
+            *data[2:]
+        )
+
+    def _main_parameter(self, data: bytes):
+        self.main[parameters.main[data[1]]] = utils.decode_nibble(*data[2:])
+
+    # requests answered
+
+    def _request_program(self, data: bytes):
+        bank, prog = data[1], data[2]
+        record = self.store.record(bank, prog)
+        self.reply(
+            evolver.serialize(
+                [
+                    Partition.PROGRAM,
+                    bank,
+                    prog,
+                    *utils.pack_msbit(record[: memory.PatchStore.NAME_OFFSET]),
+                ]
+            )
+        )
+
+    def _request_edit(self, data: bytes):
+        self.reply(
+            evolver.serialize([Partition.EDIT, *utils.pack_msbit(self.edit)])
+        )
+
+    def _request_waveshape(self, data: bytes):
+        n = data[1]
+        self.reply(
+            evolver.serialize(
+                [
+                    Partition.WAVESHAPE,
+                    n,
+                    *evolver.serialize_waveshape(self.waveshapes[n]),
+                ]
+            )
+        )
+
+    def _request_main(self, data: bytes):
+        self.reply(
+            evolver.serialize(
+                [Partition.MAIN, *evolver.serialize_main(self.main)]
+            )
+        )
+
+    def _request_name(self, data: bytes):
+        bank, prog = data[1], data[2]
+        name = self.store.name(bank, prog).encode("ascii")
+        self.reply(evolver.serialize([Partition.NAME, bank, prog, *name]))
+
+    def stats(self) -> dict:
+        return {
+            "received_messages": self.received_messages,
+            "received_bytes": self.received_bytes,
+            "sent_messages": self.sent_messages,
+            "sent_bytes": self.sent_bytes,
+        }
+
+
+# handlers keyed on (command byte, message length), as evolver._receivers
+_handlers = {
+    (Partition.PROGRAM, 3 + Length.PROGRAM): VirtualEvolver._program,
+    (Partition.EDIT, 1 + Length.PROGRAM): VirtualEvolver._edit,
+    (Partition.WAVESHAPE, 2 + Length.WAVESHAPE): VirtualEvolver._waveshape,
+    (Partition.MAIN, 1 + Length.MAIN): VirtualEvolver._main,
+    (Partition.NAME, 3 + Length.NAME): VirtualEvolver._name,
+    (Parameter.PROGRAM, 4): VirtualEvolver._program_parameter,
+    (Parameter.SEQUENCER, 4): VirtualEvolver._sequencer_parameter,
+    (Parameter.MAIN, 4): VirtualEvolver._main_parameter,
+    (Request.PROGRAM, 3): VirtualEvolver._request_program,
+    (Request.EDIT, 1): VirtualEvolver._request_edit,
+    (Request.WAVESHAPE, 2): VirtualEvolver._request_waveshape,
+    (Request.MAIN, 1): VirtualEvolver._request_main,
+    (Request.NAME, 3): VirtualEvolver._request_name,
+}
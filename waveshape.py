@@ -0,0 +1,167 @@
+# waveshape.py
+# the 128 waveshapes of the evolver as one 16-bit array
+
+import os
+import sys
+from array import array
+from itertools import repeat
+from time import perf_counter
+
+import evolver
+import utils
+from evolver import Length
+
+SHAPES = 128
+POINTS = 128
+SIZE = 2 * POINTS
+# shapes padded to whole groups of 7 bytes pack to whole groups of 8, of
+# which the first Length.WAVESHAPE bytes are the packed shape
+_PADDED = -(-SIZE // 7) * 7
+_PADDED_PACKED = utils.packed_length(_PADDED)
+
+
+def filename(n: int, directory: str = "waveshapes") -> str:
+    return os.path.join(directory, f"waveform_{n:03}.wav")
+
+
+class WaveshapeBank:
+    """all waveshapes in one int16 array
+
+    indexing gives the 256 byte little endian form that is stored in
+    memory.waveshape and sent on the wire, so a bank can be used wherever
+    that dict is.
+    """
+
+    def __init__(self, points: array = None):
+        self.points = array("h", bytes(SHAPES * SIZE))
+        if points is not None:
+            self.points[:] = array("h", points)
+
+    def __len__(self) -> int:
+        return SHAPES
+
+    def __iter__(self):
+        return iter(range(SHAPES))
+
+    def __getitem__(self, n: int) -> bytes:
+        if n not in range(SHAPES):
+            raise IndexError(f"no such waveshape: {n=}")
+        shape = self.points[n * POINTS : (n + 1) * POINTS]
+        if sys.byteorder == "big":
+            shape.byteswap()
+        return shape.tobytes()
+
+    def __setitem__(self, n: int, shape: bytes):
+        if n not in range(SHAPES):
+            raise IndexError(f"no such waveshape: {n=}")
+        points = array("h", bytes(shape))
+        if len(points) != POINTS:
+            raise ValueError(f"{len(points)=}. should be {POINTS}.")
+        if sys.byteorder == "big":
+            points.byteswap()
+        self.points[n * POINTS : (n + 1) * POINTS] = points
+
+    def get(self, n: int, default=None):
+        return self[n] if n in range(SHAPES) else default
+
+    def items(self):
+        return ((n, self[n]) for n in range(SHAPES))
+
+    def little_endian(self) -> bytes:
+        """all shapes as one little endian buffer"""
+        points = array("h", self.points)
+        if sys.byteorder == "big":
+            points.byteswap()
+        return points.tobytes()
+
+    def to_wire(self) -> list:
+        """every shape as a Partition.WAVESHAPE payload, packed in one pass"""
+        data = self.little_endian()
+        padded = bytearray(SHAPES * _PADDED)
+        for n in range(SHAPES):
+            padded[n * _PADDED : n * _PADDED + SIZE] = data[
+                n * SIZE : (n + 1) * SIZE
+            ]
+        packed = bytearray(SHAPES * _PADDED_PACKED)
+        utils.pack_msbit_into(padded, packed)
+        return [
+            bytes(packed[start : start + Length.WAVESHAPE])
+            for start in range(0, len(packed), _PADDED_PACKED)
+        ]
+
+    def from_wire(self, payloads: dict):
+        """set shapes from {n: Partition.WAVESHAPE payload}, in one pass"""
+        padded = bytearray(len(payloads) * _PADDED_PACKED)
+        for n, payload in enumerate(payloads.values()):
+            if len(payload) != Length.WAVESHAPE:
+                raise ValueError(f"{len(payload)=}. should be 293.")
+            start = n * _PADDED_PACKED
+            padded[start : start + Length.WAVESHAPE] = utils.as_bytes(payload)
+        unpacked = bytearray(len(payloads) * _PADDED)
+        utils.unpack_msbit_into(padded, unpacked)
+        for n, shape in enumerate(payloads):
+            self[shape] = unpacked[n * _PADDED : n * _PADDED + SIZE]
+
+    def load(self, n: int, filename: str, normalize: bool = False):
+        """load a shape from a .wav of any length"""
+        self[n] = utils.load_waveshape(filename, POINTS, normalize)
+
+    def save(self, n: int, filename: str):
+        utils.save_waveshape(filename, self[n])
+
+    @classmethod
+    def load_directory(cls, directory: str = "waveshapes") -> "WaveshapeBank":
+        """bank from the waveform_nnn.wav files in 'directory'"""
+        bank = cls()
+        for n in range(SHAPES):
+            bank.load(n, filename(n, directory))
+        return bank
+
+    def save_directory(self, directory: str = "waveshapes"):
+        os.makedirs(directory, exist_ok=True)
+        for n in range(SHAPES):
+            self.save(n, filename(n, directory))
+
+
+def convert(filename: str, normalize: bool = True) -> tuple:
+    """decode, normalize and resample a .wav, return shape, payload, seconds"""
+    start = perf_counter()
+    shape = utils.load_waveshape(filename, POINTS, normalize)
+    payload = evolver.serialize_waveshape(shape)
+    return shape, payload, perf_counter() - start
+
+
+def convert_files(
+    filenames: list,
+    bank: WaveshapeBank,
+    first: int = 0,
+    workers: int = None,
+    normalize: bool = True,
+):
+    """convert .wav files into consecutive slots of 'bank' on all cores
+
+    yields (slot, filename, payload, seconds) in the order of 'filenames' as
+    each result is stored. raises ValueError before converting anything if
+    the files do not fit in the slots from 'first'.
+    """
+    # the process pool machinery is only loaded when files are converted
+    from concurrent.futures import ProcessPoolExecutor
+
+    filenames = list(filenames)
+    if first not in range(SHAPES) or len(filenames) > SHAPES - first:
+        raise ValueError(
+            f"{len(filenames)} files do not fit in slots {first}-{SHAPES - 1}"
+        )
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as pool:
+        results = pool.map(
+            convert,
+            filenames,
+            repeat(normalize),
+            chunksize=max(1, len(filenames) // (8 * workers)),
+        )
+        for slot, name, (shape, payload, seconds) in zip(
+            range(first, SHAPES), filenames, results
+        ):
+            bank[slot] = shape
+            yield slot, name, payload, seconds